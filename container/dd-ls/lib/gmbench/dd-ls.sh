@@ -32,6 +32,19 @@ if [[ ! -d "${output_dir}" ]]; then
 		>"${output_temp_dir}/stdout.txt" \
 		2>"${output_temp_dir}/stderr.txt" || true
 
+	if [[ "${GMBENCH_CAPTURE:-0}" -eq 1 ]]; then
+		# The parser needs both stdout.txt and output.txt, the latter is
+		# written by the solver itself. So we can not parse while the solver
+		# is running, but we parse the logs on the local file system right
+		# away and drop them afterwards (see `bin/process-logs`).
+		if bin/process-logs --compress=nonmonotonous --delta-assignments \
+			--work-directory="${output_temp_dir}" "${output_dir}" \
+			&& [[ "${GMBENCH_KEEP_RAW_LOGS:-0}" -ne 1 ]]
+		then
+			rm "${output_temp_dir}/stdout.txt" "${output_temp_dir}/output.txt"
+		fi
+	fi
+
 	(cd "${output_temp_dir}" && gzip *.txt)
 
 	mv -T "${output_temp_dir}" "${output_dir}"
@@ -25,12 +25,29 @@ output_temp_dir=$(umask 0077 && mktemp -d)
 trap 'rm -rf "${output_temp_dir}"' EXIT
 
 if [[ ! -d "${output_dir}" ]]; then
-	timeout -k 60 -s INT 500 qap_dd "${PARAMETERS[@]}" \
-		--seed 42 \
-		--output "${output_temp_dir}/output.txt" \
-		"${input}" \
-		>"${output_temp_dir}/stdout.txt" \
-		2>"${output_temp_dir}/stderr.txt" || true
+	if [[ "${GMBENCH_CAPTURE:-0}" -eq 1 ]]; then
+		# Parse the solver output while the solver is running and only keep
+		# the resulting data file (see `bin/process-logs --capture`).
+		process_logs_args=(--capture --compress=nonmonotonous --delta-assignments)
+		if [[ "${GMBENCH_KEEP_RAW_LOGS:-0}" -eq 1 ]]; then
+			process_logs_args+=(--keep-raw-log)
+		fi
+
+		timeout -k 60 -s INT 500 qap_dd "${PARAMETERS[@]}" \
+			--seed 42 \
+			--output "${output_temp_dir}/output.txt" \
+			"${input}" \
+			2>"${output_temp_dir}/stderr.txt" \
+		| bin/process-logs "${process_logs_args[@]}" \
+			--work-directory="${output_temp_dir}" "${output_dir}" || true
+	else
+		timeout -k 60 -s INT 500 qap_dd "${PARAMETERS[@]}" \
+			--seed 42 \
+			--output "${output_temp_dir}/output.txt" \
+			"${input}" \
+			>"${output_temp_dir}/stdout.txt" \
+			2>"${output_temp_dir}/stderr.txt" || true
+	fi
 
 	(cd "${output_temp_dir}" && gzip *.txt)
 
@@ -27,9 +27,23 @@ trap 'rm -rf "${output_temp_dir}"' EXIT
 if [[ ! -d "${output_dir}" ]]; then
 	xzcat "${input}" >"${output_temp_dir}/input.dd"
 
-	timeout -k 60 -s INT 500 "${COMMAND[@]}" "${output_temp_dir}/input.dd" \
-		>"${output_temp_dir}/stdout.txt" \
-		2>"${output_temp_dir}/stderr.txt" || true
+	if [[ "${GMBENCH_CAPTURE:-0}" -eq 1 ]]; then
+		# Parse the solver output while the solver is running and only keep
+		# the resulting data file (see `bin/process-logs --capture`).
+		process_logs_args=(--capture --compress=nonmonotonous --delta-assignments)
+		if [[ "${GMBENCH_KEEP_RAW_LOGS:-0}" -eq 1 ]]; then
+			process_logs_args+=(--keep-raw-log)
+		fi
+
+		timeout -k 60 -s INT 500 "${COMMAND[@]}" "${output_temp_dir}/input.dd" \
+			2>"${output_temp_dir}/stderr.txt" \
+		| bin/process-logs "${process_logs_args[@]}" \
+			--work-directory="${output_temp_dir}" "${output_dir}" || true
+	else
+		timeout -k 60 -s INT 500 "${COMMAND[@]}" "${output_temp_dir}/input.dd" \
+			>"${output_temp_dir}/stdout.txt" \
+			2>"${output_temp_dir}/stderr.txt" || true
+	fi
 
 	rm "${output_temp_dir}/input.dd"
 	(cd "${output_temp_dir}" && gzip *.txt)
@@ -4,18 +4,28 @@ import argparse
 import os
 import sys
 
+import gmbench.analyzer.add_checkpoint
 import gmbench.analyzer.add_hardware
+import gmbench.analyzer.anytime
+import gmbench.analyzer.archive_run
 import gmbench.analyzer.export
 import gmbench.analyzer.generate_table
 import gmbench.analyzer.import_benchmark
 import gmbench.analyzer.import_datasets
 import gmbench.analyzer.init_database
+import gmbench.analyzer.merge
+import gmbench.analyzer.migrate_assignments
+import gmbench.analyzer.migrate_output
+import gmbench.analyzer.perf_sweep
+import gmbench.analyzer.plot_anytime
 import gmbench.analyzer.plot_cactus
 import gmbench.analyzer.plot_perf
 import gmbench.analyzer.postprocess
 import gmbench.analyzer.remove_slow_trials
+import gmbench.analyzer.restore_run
 import gmbench.analyzer.verify
 import gmbench.analyzer.verify_assignments
+import gmbench.db
 
 
 def main():
@@ -24,15 +34,26 @@ def main():
         del os.environ['OVERRIDE_ARGV0']
 
     parser = argparse.ArgumentParser()
+    parser.add_argument('--database', '-D', default=gmbench.db.DB_FILE,
+                        help='Path of the benchmark database (default: %(default)s, '
+                             'see also $GMBENCH_DATABASE)')
     subparsers = parser.add_subparsers()
     for name, module in sys.modules.items():
         if name.startswith('gmbench.analyzer.'):
             subparser = module.init_subparser(subparsers)
             subparser.set_defaults(module=module)
     args = parser.parse_args()
+    gmbench.db.DB_FILE = args.database
+    # Worker processes that are spawned instead of forked import `gmbench.db`
+    # afresh and read the path from the environment.
+    os.environ['GMBENCH_DATABASE'] = args.database
 
     if 'module' in args:
-        args.module.execute(args)
+        try:
+            args.module.execute(args)
+        except gmbench.db.SchemaError as e:
+            print(f'Error: {e}', file=sys.stderr)
+            sys.exit(1)
     else:
         parser.print_usage(sys.stderr)
         sys.exit(2)
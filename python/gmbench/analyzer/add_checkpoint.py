@@ -0,0 +1,29 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import gmbench.cache
+import gmbench.checkpoint
+import gmbench.db
+
+
+def init_subparser(subparsers):
+    parser = subparsers.add_parser('add-checkpoint')
+    parser.add_argument('times', metavar='time', type=int, nargs='+',
+                        help='Checkpoint time in seconds')
+    return parser
+
+
+def execute(args):
+    with gmbench.db.connect() as db:
+        output = gmbench.cache.ensure(db)
+        with db:
+            db.executemany('INSERT OR IGNORE INTO checkpoint (time) VALUES (?)',
+                           [(t,) for t in args.times])
+            version = gmbench.db.data_version(db)
+
+            # Only the rows of the new checkpoints are computed.
+            gmbench.checkpoint.refresh(db, output)
+            gmbench.db.bump_data_version(db)
+
+        # The summary tables are stale now, but `output_postprocessed` has not
+        # changed, so the cache stays valid.
+        gmbench.cache.rename_version(version, gmbench.db.data_version(db))
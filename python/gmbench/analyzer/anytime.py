@@ -0,0 +1,70 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import math
+import sys
+
+import gmbench.anytime
+import gmbench.db
+
+
+def parse_times(s):
+    return tuple(float(x) for x in s.split(','))
+
+
+def parse_log_times(s):
+    start, stop, num = s.split(',')
+    return tuple(gmbench.anytime.log_times(float(start), float(stop), int(num)))
+
+
+def init_subparser(subparsers):
+    parser = subparsers.add_parser('anytime')
+    parser.add_argument('--run', '-r', type=int, required=True)
+    parser.add_argument('--dataset', '-d')
+    parser.add_argument('--method', '-m', action='append', dest='methods',
+                        help='Only show this method (can be given multiple times)')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--times', '-t', metavar='T1,T2,...', type=parse_times,
+                       help='Times in seconds')
+    group.add_argument('--log-times', '-L', metavar='START,STOP,NUM', type=parse_log_times,
+                       dest='times', help='NUM logarithmically spaced times')
+    return parser
+
+
+def format_value(x):
+    return '' if math.isnan(x) else f'{x:.6g}'
+
+
+def execute(args):
+    with gmbench.db.connect(readonly=True) as db:
+        with db:
+            try:
+                dataset_id = None
+                if args.dataset:
+                    dataset_id, = gmbench.anytime.lookup_ids(db, 'dataset', [args.dataset])
+                method_ids = None
+                if args.methods:
+                    method_ids = gmbench.anytime.lookup_ids(db, 'method', args.methods)
+            except gmbench.anytime.AnytimeError as e:
+                print(f'Error: {e}', file=sys.stderr)
+                sys.exit(1)
+            state = gmbench.anytime.compute_state(db, args.run, args.times,
+                                                  dataset_id=dataset_id,
+                                                  method_ids=method_ids)
+
+            methods = dict(db.execute('SELECT id, name FROM method').fetchall())
+            instances = {row[0]: row[1:] for row in db.execute(
+                'SELECT instance.id, dataset.name, instance.name FROM instance '
+                'INNER JOIN dataset ON dataset.id = instance.dataset_id')}
+
+    print('method\tdataset\tinstance\ttime\tvalue\tbound\toptimal\t'
+          'accuracy_all_nodes\taccuracy_known_nodes')
+    for i, (method_id, instance_id) in enumerate(zip(state.method_ids.tolist(),
+                                                     state.instance_ids.tolist())):
+        dataset, instance = instances[instance_id]
+        for j, time in enumerate(state.times.tolist()):
+            optimal = state.optimal[i, j]
+            print(f'{methods[method_id]}\t{dataset}\t{instance}\t{time:.6g}\t'
+                  f'{state.value[i, j]:.6g}\t{state.bound[i, j]:.6g}\t'
+                  f'{"" if math.isnan(optimal) else int(optimal)}\t'
+                  f'{format_value(state.accuracy_all_nodes[i, j])}\t'
+                  f'{format_value(state.accuracy_known_nodes[i, j])}')
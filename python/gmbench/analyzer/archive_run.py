@@ -0,0 +1,28 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import sys
+
+import gmbench.archive
+import gmbench.db
+
+
+def init_subparser(subparsers):
+    parser = subparsers.add_parser('archive-run')
+    parser.add_argument('--run', '-r', type=int, required=True)
+    return parser
+
+
+def execute(args):
+    with gmbench.db.connect() as db:
+        size_before = gmbench.db.database_size(db)
+        try:
+            num_rows, num_assignments = gmbench.archive.archive_run(db, args.run)
+        except gmbench.archive.ArchiveError as e:
+            print(f'Error: {e}', file=sys.stderr)
+            sys.exit(1)
+        db.execute('VACUUM')
+        size_after = gmbench.db.database_size(db)
+
+        print(f'Run {args.run} archived to {gmbench.archive.archive_filename(args.run)} '
+              f'({num_rows} output rows, {num_assignments} assignments, '
+              f'database size {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB).')
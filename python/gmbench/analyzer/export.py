@@ -1,12 +1,46 @@
 # Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
 
 import gzip
+import itertools
 import json
 import math
+import os
+import os.path
 import sys
+from collections import namedtuple
 
 import gmbench.db
 import gmbench.perf
+import gmbench.summary
+
+# The export can get very large, so it is not built as one nested dict in
+# memory. Instead, the large parts are generated lazily from database cursors
+# while they are written: An `ObjectStream` is written as JSON object of its
+# (key, value) pairs, a `ListStream` as JSON array of its items. Everything
+# else is written with `json.dumps`.
+ObjectStream = namedtuple('ObjectStream', 'items')
+ListStream = namedtuple('ListStream', 'items')
+
+SQL_RESULTS_PER_INSTANCE = '''
+    SELECT
+        benchmark.checkpoint                AS checkpoint,
+        dataset.name                        AS dataset,
+        instance.name                       AS instance,
+        method.name                         AS method,
+        coalesce(benchmark.value,  1e999)   AS value,
+        coalesce(benchmark.bound, -1e999)   AS bound,
+        benchmark.optimal                   AS optimal,
+        benchmark.accuracy_all_nodes        AS accuracy_all_nodes,
+        benchmark.accuracy_known_nodes      AS accuracy_known_nodes
+    FROM benchmark
+    INNER JOIN method   ON method.id   = benchmark.method_id
+    INNER JOIN instance ON instance.id = benchmark.instance_id
+    INNER JOIN dataset  ON dataset.id  = instance.dataset_id
+    WHERE benchmark.run_id = :run_id
+      AND (:checkpoint IS NULL OR benchmark.checkpoint = :checkpoint)
+      AND (:dataset_id IS NULL OR dataset.id = :dataset_id)
+    ORDER BY benchmark.checkpoint, dataset.id, instance.id, method.id
+'''
 
 
 def cleanup_dict_entry(dictionary, key, func):
@@ -42,64 +76,75 @@ def select_checkpoints(db):
     return [row['time'] for row in cur]
 
 
+def select_instances(db, dataset_id):
+    cur = db.execute('SELECT number, name, optimum, groundtruth FROM instance '
+                     'WHERE dataset_id = ? ORDER BY number, name', (dataset_id,))
+    for row in cur:
+        value = {k: row[k] for k in row.keys()}
+        cleanup_dict_entry(value, 'groundtruth', convert_from_json)
+        yield value
+
+
 def select_datasets(db):
     cur = db.execute('''
         SELECT
-            dataset.name AS dataset,
-            instance.number,
-            instance.name,
-            instance.optimum,
-            instance.groundtruth
+            dataset.id,
+            dataset.name,
+            count(*)                    AS total,
+            count(instance.optimum)     AS optima_known,
+            count(instance.groundtruth) AS groundtruth_known
         FROM instance
         INNER JOIN dataset ON dataset.id = instance.dataset_id
-        ORDER BY dataset.name, instance.number, instance.name
+        GROUP BY dataset.id
+        ORDER BY dataset.name
     ''')
 
-    data = {}
-    for row in cur:
-        value = {
-            k: row[k] for k in row.keys()
-            if k not in ('dataset', )
-        }
-
-        cleanup_dict_entry(value, 'groundtruth', convert_from_json)
-
-        data.setdefault(row['dataset'], {}) \
-            .setdefault('instances', []).append(value)
-
-    for dataset in data.values():
-        instances = dataset['instances']
-        dataset['total'] = len(instances)
-        dataset['optima_known'] = sum(i['optimum'] is not None for i in instances)
-        dataset['groundtruth_known'] = sum(i['groundtruth'] is not None for i in instances)
-
-    return data
-
-
-def select_results_per_instance(db, run_id):
-    cur = db.execute('SELECT * FROM benchmark_pretty WHERE run_id = ?',
-                     (run_id,))
-    data = {}
-    for row in cur:
-        value = {
-            k: row[k] for k in row.keys()
-            if k not in ('checkpoint', 'dataset', 'instance', 'run_id')
-        }
-
-        cleanup_dict_entry(value, 'value', cleanup_value)
-        cleanup_dict_entry(value, 'bound', cleanup_bound)
-        cleanup_dict_entry(value, 'optimal', convert_to_bool)
-
-        d = data.setdefault(row['checkpoint'], {}) \
-                .setdefault(row['dataset'],    {}) \
-                .setdefault(row['instance'],   {})
-        assert row['method'] not in d
-        d[row['method']] = value
-
-    return data
+    for row in cur.fetchall():
+        yield row['name'], ObjectStream([
+            ('instances', ListStream(select_instances(db, row['id']))),
+            ('total', row['total']),
+            ('optima_known', row['optima_known']),
+            ('groundtruth_known', row['groundtruth_known']),
+        ])
+
+
+def group_results_per_instance(rows, keys):
+    # The rows are sorted by all `keys`, so each group is a contiguous run of
+    # rows that is written before the next group is read.
+    if not keys:
+        for row in rows:
+            value = {
+                k: row[k] for k in row.keys()
+                if k not in ('checkpoint', 'dataset', 'instance')
+            }
+
+            cleanup_dict_entry(value, 'value', cleanup_value)
+            cleanup_dict_entry(value, 'bound', cleanup_bound)
+            cleanup_dict_entry(value, 'optimal', convert_to_bool)
+            yield row['method'], value
+        return
+
+    key, *keys = keys
+    for name, group in itertools.groupby(rows, key=lambda row: row[key]):
+        yield name, ObjectStream(group_results_per_instance(group, keys))
+
+
+def select_results_per_instance(db, run_id, checkpoint=None, dataset_id=None):
+    """Returns the results nested by checkpoint, dataset, instance and method.
+
+    The levels of a given checkpoint or dataset are left out.
+    """
+    cur = db.execute(SQL_RESULTS_PER_INSTANCE, {'run_id': run_id,
+                                                'checkpoint': checkpoint,
+                                                'dataset_id': dataset_id})
+    keys = [key for key, fixed in (('checkpoint', checkpoint), ('dataset', dataset_id),
+                                   ('instance', None))
+            if fixed is None]
+    return ObjectStream(group_results_per_instance(cur, keys))
 
 
 def select_results_per_dataset(db, run_id):
+    gmbench.summary.ensure(db)
     cur = db.execute('SELECT * FROM benchmark_per_dataset_pretty WHERE run_id = ?',
                      (run_id,))
     data = {}
@@ -118,47 +163,138 @@ def select_results_per_dataset(db, run_id):
 
 
 def construct_performance_plot_data(db, run_id):
-    result = {'all': gmbench.perf.compute_performance_plot_data(db, run_id)}
+    datasets = db.execute('SELECT id, name FROM dataset').fetchall()
+    profiles = gmbench.perf.compute_performance_plot_data_for_datasets(
+        db, run_id, [None] + [dataset_id for dataset_id, _ in datasets])
 
-    cur = db.execute('SELECT id, name FROM dataset')
-    for row in cur:
-        dataset_id, dataset = row
-        result[dataset] = gmbench.perf.compute_performance_plot_data(db, run_id, dataset_id)
+    result = {'all': profiles[0]}
+    for (_, dataset), data in zip(datasets, profiles[1:]):
+        result[dataset] = data
 
     return result
 
 
-def construct_export_dict(db, run_id):
-    return {
-        'algorithms': select_algorithms(db),
-        'checkpoints': select_checkpoints(db),
-        'datasets': select_datasets(db),
-        'results': {
-            'per_instance': select_results_per_instance(db, run_id),
-            'per_dataset': select_results_per_dataset(db, run_id),
-        },
-        'performance_plot_parameters': {
+def construct_export(db, run_id, per_instance=None):
+    """Returns the export as `ObjectStream`.
+
+    The per-instance results can be replaced by `per_instance` (e.g. by the
+    names of the shard files).
+    """
+    if per_instance is None:
+        per_instance = ('per_instance', select_results_per_instance(db, run_id))
+
+    return ObjectStream([
+        ('algorithms', select_algorithms(db)),
+        ('checkpoints', select_checkpoints(db)),
+        ('datasets', ObjectStream(select_datasets(db))),
+        ('results', ObjectStream([
+            per_instance,
+            ('per_dataset', select_results_per_dataset(db, run_id)),
+        ])),
+        ('performance_plot_parameters', {
             'max_perf_ratio': gmbench.perf.DEFAULT_MAX_PERF_RATIO,
             'min_runtime': gmbench.perf.DEFAULT_MIN_RUNTIME,
             'optimality_tolerance': gmbench.perf.DEFAULT_OPTIMALITY_TOLERANCE,
-        },
-        'performance_plot_data': construct_performance_plot_data(db, run_id),
-    }
+        }),
+        ('performance_plot_data', construct_performance_plot_data(db, run_id)),
+    ])
+
+
+def write_json(f, obj, indent=None, level=0):
+    """Writes `obj` like `json.dump`, but consumes the streams while writing.
+
+    Without `indent` the output is compact, i.e. without any whitespace.
+    """
+    if isinstance(obj, ObjectStream):
+        items, begin, end = obj.items, '{', '}'
+    elif isinstance(obj, ListStream):
+        items, begin, end = ((None, item) for item in obj.items), '[', ']'
+    else:
+        if indent is None:
+            f.write(json.dumps(obj, separators=(',', ':')))
+        else:
+            f.write(json.dumps(obj, indent=indent).replace('\n', '\n' + ' ' * indent * level))
+        return
+
+    if indent is None:
+        newline, key_separator, closing = '', ':', ''
+    else:
+        newline = '\n' + ' ' * indent * (level + 1)
+        key_separator, closing = ': ', '\n' + ' ' * indent * level
+
+    f.write(begin)
+    empty = True
+    for key, value in items:
+        f.write(newline if empty else ',' + newline)
+        if isinstance(obj, ObjectStream):
+            # Keys are converted like `json.dumps` does.
+            f.write(json.dumps(key if isinstance(key, str) else json.dumps(key)))
+            f.write(key_separator)
+        write_json(f, value, indent, level + 1)
+        empty = False
+    f.write(end if empty else closing + end)
+
+
+def open_output(filename, compress):
+    open_func = gzip.open if compress else open
+    return open_func(filename, 'wt')
+
+
+def write_export(filename, obj, args):
+    with open_output(filename, args.compress) as f:
+        write_json(f, obj, indent=None if args.compact else 4)
+        f.write('\n')
+
+
+def write_shards(db, args):
+    """Writes the per-instance results into one file per checkpoint or dataset.
+
+    Returns the mapping from checkpoint or dataset to the file name.
+    """
+    if args.shard == 'checkpoint':
+        cur = db.execute('SELECT time, time FROM checkpoint ORDER BY time')
+    else:
+        cur = db.execute('SELECT name, id FROM dataset ORDER BY name')
+
+    shards = {}
+    for name, key in cur.fetchall():
+        filename = f'per_instance-{args.shard}-{name}.json'
+        if args.compress:
+            filename += '.gz'
+        shards[name] = filename
+
+        if args.shard == 'checkpoint':
+            results = select_results_per_instance(db, args.run, checkpoint=key)
+        else:
+            results = select_results_per_instance(db, args.run, dataset_id=key)
+        write_export(os.path.join(args.output, filename), results, args)
+
+    return shards
 
 
 def init_subparser(subparsers):
     parser = subparsers.add_parser('export')
     parser.add_argument('--run', '-r', type=int, required=True)
-    parser.add_argument('--output', '-o', required=True)
+    parser.add_argument('--output', '-o', required=True,
+                        help='Output file (output directory with --shard)')
     parser.add_argument('--compress', '-c', action='store_true')
+    parser.add_argument('--compact', action='store_true',
+                        help='Write JSON without indentation')
+    parser.add_argument('--shard', choices=('checkpoint', 'dataset'),
+                        help='Write the per-instance results into one file per '
+                             'checkpoint or dataset and everything else into index.json')
     return parser
 
 
 def execute(args):
-    open_func = gzip.open if args.compress else open
-    with open_func(args.output, 'wt') as f:
-        with gmbench.db.connect() as db:
-            with db:
-                obj = construct_export_dict(db, args.run)
-        json.dump(obj, f, indent=4)
-        f.write('\n')
+    with gmbench.db.connect() as db:
+        with db:
+            if args.shard is None:
+                write_export(args.output, construct_export(db, args.run), args)
+            else:
+                os.makedirs(args.output, exist_ok=True)
+                shards = write_shards(db, args)
+                filename = 'index.json.gz' if args.compress else 'index.json'
+                write_export(os.path.join(args.output, filename),
+                             construct_export(db, args.run, ('per_instance_shards', shards)),
+                             args)
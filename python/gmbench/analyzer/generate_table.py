@@ -5,6 +5,7 @@ import sys
 from collections import namedtuple
 
 import gmbench.db
+import gmbench.summary
 
 
 Result = namedtuple('Result', 'value bound feasible total optimal optima_known accuracy')
@@ -46,17 +47,6 @@ def get_checkpoints(db):
         yield time
 
 
-def materialize_view(db, run_id):
-    # We materialize the view `main.benchmark_per_dataset_pretty` into
-    # a temporary table `temp.benchmark_per_dataset_pretty`. Note that
-    # later usage of unqualified `benchmark_per_dataset_pretty` will
-    # use the temporary (hence fast) one.
-    db.execute('CREATE TEMPORARY TABLE benchmark_per_dataset_pretty AS '
-               '  SELECT * FROM benchmark_per_dataset_pretty '
-               '  WHERE run_id = ?',
-               (run_id,))
-
-
 def generate_html_table(db, run_id, checkpoint, dataset):
     print(f'<table border><caption>{dataset} ({checkpoint}s)</caption>')
     print(f'<tr><th>method</th><th>avg value</th><th>avg bound</th><th>feasible</th><th>optimal</th></tr>')
@@ -67,7 +57,6 @@ def generate_html_table(db, run_id, checkpoint, dataset):
 
 
 def generate_html(args, db):
-    materialize_view(db, args.run)
     print('<!DOCTYPE html5>')
     print('<html lang="en"><body><h1>Graph Matching Benchmark Results</h1>')
 
@@ -80,8 +69,6 @@ def generate_html(args, db):
 
 
 def generate_paper_table(db, run_id, columns, rows):
-    materialize_view(db, run_id)
-
     # Fetch all results from the database.
     table = {}
     for method in rows:
@@ -221,5 +208,6 @@ def generate_paper_dataset(args, db):
 
 def execute(args):
     with gmbench.db.connect() as db:
+        gmbench.summary.ensure(db)
         func_name = args.kind.replace('-', '_')
         globals()[f'generate_{func_name}'](args, db)
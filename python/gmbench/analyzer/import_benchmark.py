@@ -2,22 +2,53 @@
 
 #!/usr/bin/env python3
 
+import collections
 import gzip
+import hashlib
 import json
+import multiprocessing
 import os
 import os.path
 import sys
+import time
+from collections import namedtuple
 
+import gmbench.archive
+import gmbench.assignment
 import gmbench.db
 
 
-DATA_FILENAME = 'data.json.gz'
+# Supported data file names written by `bin/process-logs`. If a directory
+# contains more than one of them, the first one in this list is used.
+DATA_FILENAMES = ('data.npz', 'data.json.gz')
+
+# Maximum number of data files that are parsed ahead of the database writer.
+MAX_PENDING_FILES_PER_JOB = 8
+
+
+# Result of parsing a data file in a worker process. Each row is a tuple
+# `(time, value, bound, assignment_ref)` where `assignment_ref` is None or an
+# index into `assignments`. Each entry of `assignments` is a tuple
+# `(value, base_ref, hash)`: If `base_ref` is None, `value` is the encoded full
+# assignment, otherwise `value` is the delta against entry `base_ref`. The
+# `hash` is the digest of the full assignment.
+DataFile = namedtuple('DataFile', 'filename stat hash method dataset instance trial rows assignments')
+
+# File identity as recorded in the `import_manifest` table.
+FileStat = namedtuple('FileStat', 'size mtime_ns')
 
 
 def init_subparser(subparsers):
     parser = subparsers.add_parser('import-benchmark')
     parser.add_argument('--date', '-d')
-    parser.add_argument('--hardware', '-H', required=True)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--hardware', '-H', help='Import into a new run for this hardware')
+    group.add_argument('--append-to-run', '-a', type=int, metavar='RUN',
+                       help='Import into an existing run. Files that were imported '
+                            'before (same PATH) are skipped if they did not change, '
+                            'otherwise the affected trials are replaced.')
+    parser.add_argument('--jobs', '-j', type=int,
+                        help='Number of worker processes for parsing (default: number of CPUs)')
     parser.add_argument('paths', metavar='PATH', nargs='+', help='Path to benchmark directory')
     return parser
 
@@ -25,13 +56,77 @@ def init_subparser(subparsers):
 def find_data_files(paths):
     for path in paths:
         for root, dirs, files in os.walk(path):
-            if DATA_FILENAME in files:
-                yield os.path.join(root, DATA_FILENAME)
+            for filename in DATA_FILENAMES:
+                if filename in files:
+                    yield os.path.normpath(os.path.join(root, filename))
+                    break
 
 
-def parse_data_file(filename):
+def stat_file(filename):
+    st = os.stat(filename)
+    return FileStat(size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+
+def hash_file(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def parse_json_data_file(filename):
     with gzip.open(filename, 'rt') as f:
-        return json.load(f)
+        data = json.load(f)
+
+    # Data points can store their assignment as delta against the assignment
+    # of the last data point that stores a full one.
+    base = None
+    for dp in data['datapoints']:
+        if 'assignment_delta' in dp:
+            dp['assignment'] = gmbench.assignment.apply_delta(base, dp.pop('assignment_delta'))
+        elif dp['assignment']:
+            base = dp['assignment']
+
+    return data
+
+
+def parse_npz_data_file(filename):
+    import numpy
+
+    with numpy.load(filename, allow_pickle=False) as f:
+        assignments = f['assignments'].tolist()
+        datapoints = [{'time': time,
+                       'value': value,
+                       'bound': bound,
+                       'assignment': assignments[index] if index >= 0 else None}
+                      for time, value, bound, index in zip(f['time'].tolist(),
+                                                           f['value'].tolist(),
+                                                           f['bound'].tolist(),
+                                                           f['assignment_index'].tolist())]
+
+        # Delta-encoded files store for each data point a (possibly empty)
+        # range of `[index, label]` pairs to apply to its referenced row.
+        if 'delta_offsets' in f:
+            offsets = f['delta_offsets'].tolist()
+            delta = list(zip(f['delta_index'].tolist(), f['delta_label'].tolist()))
+            for dp, begin, end in zip(datapoints, offsets, offsets[1:]):
+                if begin != end:
+                    dp['assignment'] = gmbench.assignment.apply_delta(dp['assignment'],
+                                                                      delta[begin:end])
+
+        return {'method':       str(f['method']),
+                'trial':        int(f['trial']),
+                'dataset':      str(f['dataset']),
+                'instance':     int(f['instance']),
+                'datapoints':   datapoints}
+
+
+def parse_data_file(filename):
+    if filename.endswith('.npz'):
+        return parse_npz_data_file(filename)
+    else:
+        return parse_json_data_file(filename)
 
 
 def fetch_hardware_id(db, hardware):
@@ -53,6 +148,42 @@ def insert_run(db, date, hardware_id):
     return cur.lastrowid
 
 
+def check_run_id(db, run_id):
+    cur = db.execute('SELECT id FROM run WHERE id=?', (run_id,))
+    if not cur.fetchone():
+        print('Error: Unknown run', run_id, file=sys.stderr)
+        sys.exit(1)
+    return run_id
+
+
+def fetch_manifest(db, run_id):
+    cur = db.execute('SELECT path, size, mtime_ns, hash FROM import_manifest '
+                     'WHERE run_id=?', (run_id,))
+    return {row['path']: (FileStat(row['size'], row['mtime_ns']), row['hash'])
+            for row in cur}
+
+
+def update_manifest(db, run_id, method_id, instance_id, data_file):
+    # A trial might have been imported from a different file before (e.g. a
+    # re-run that now writes another data file format), so we replace the
+    # manifest entry by trial and by path.
+    db.execute('DELETE FROM import_manifest '
+               'WHERE run_id=? AND method_id=? AND instance_id=? AND trial=?',
+               (run_id, method_id, instance_id, data_file.trial))
+    db.execute('INSERT OR REPLACE INTO import_manifest (run_id, path, size, mtime_ns, hash, '
+               '                                       method_id, instance_id, trial) '
+               'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+               (run_id, data_file.filename, data_file.stat.size, data_file.stat.mtime_ns,
+                data_file.hash, method_id, instance_id, data_file.trial))
+
+
+def delete_trial(db, run_id, method_id, instance_id, trial):
+    cur = db.execute('DELETE FROM output '
+                     'WHERE run_id=? AND method_id=? AND instance_id=? AND trial=?',
+                     (run_id, method_id, instance_id, trial))
+    return cur.rowcount > 0
+
+
 def fetch_method_id(db, method):
     cur = db.execute('SELECT id FROM method WHERE name=?', (method,))
     row = cur.fetchone()
@@ -75,24 +206,103 @@ def fetch_instance_id(db, dataset, instance):
     return row[0]
 
 
-def insert_datapoints(db, method_id, instance_id, run_id, trial, datapoints):
-    def gen():
-        for iteration, dp in enumerate(datapoints):
-            assignment_id = None
-            if dp['assignment']:
-                assignment = json.dumps(dp['assignment'])
-                cur = db.execute('SELECT id FROM assignment WHERE value=?',
-                                 (assignment,))
-                if row := cur.fetchone():
-                    assignment_id, = row
-                else:
-                    cur = db.execute('INSERT INTO assignment (value) VALUES (?)',
-                                     (assignment,))
-                    assignment_id = cur.lastrowid
-                assert assignment_id is not None
+def encode_assignments(datapoints):
+    # Assignments are stored as delta against the last full (base) assignment
+    # of this trial if only few labels have changed. This only prepares the
+    # encoding, the database ids are resolved by `insert_assignments`.
+    assignments, refs = [], []
+    base, base_ref = None, None
+    prev, prev_ref = None, None
+
+    for dp in datapoints:
+        ref = None
+        if assignment := dp['assignment']:
+            if assignment == prev:
+                ref = prev_ref
+            elif assignment == base:
+                ref = base_ref
+            elif (delta := gmbench.assignment.compute_delta(base, assignment)) is not None:
+                ref = len(assignments)
+                assignments.append((gmbench.assignment.encode_delta(delta), base_ref,
+                                    gmbench.assignment.digest(assignment)))
+            else:
+                ref = len(assignments)
+                assignments.append((gmbench.assignment.encode(assignment), None,
+                                    gmbench.assignment.digest(assignment)))
+                base, base_ref = assignment, ref
+            prev, prev_ref = assignment, ref
+        refs.append(ref)
+
+    return assignments, refs
+
+
+def load_data_file(filename):
+    # Runs in a worker process: Decompressing, decoding and encoding the
+    # assignments is the expensive part of the import.
+    stat = stat_file(filename)
+    data = parse_data_file(filename)
+    assignments, refs = encode_assignments(data['datapoints'])
+    rows = [(dp['time'], dp['value'], dp['bound'], ref)
+            for dp, ref in zip(data['datapoints'], refs)]
+    return DataFile(filename=filename,
+                    stat=stat,
+                    hash=hash_file(filename),
+                    method=data['method'],
+                    dataset=data['dataset'],
+                    instance=data['dataset'] + str(data['instance']),
+                    trial=data['trial'],
+                    rows=rows,
+                    assignments=assignments)
+
+
+def load_data_files(filenames, jobs=None):
+    # Files are parsed by a pool of worker processes and yielded in order. At
+    # most a few files per worker are parsed ahead of the consumer, so that
+    # memory usage stays bounded if the database writer is the bottleneck.
+    if jobs == 1:
+        yield from map(load_data_file, filenames)
+        return
+
+    with multiprocessing.Pool(jobs) as pool:
+        max_pending = MAX_PENDING_FILES_PER_JOB * pool._processes
+        pending = collections.deque()
+        for filename in filenames:
+            pending.append(pool.apply_async(load_data_file, (filename,)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+
+
+def insert_assignments(db, index, assignments):
+    # Known assignments are looked up in the in-memory index, all new ones are
+    # inserted at once. Full assignments are only deduplicated against other
+    # full assignments, because delta-encoded rows need a full row as base.
+    ids, new_rows = [], []
+    for value, base_ref, h in assignments:
+        full = base_ref is None
+        if (assignment_id := index.lookup(h, full=full)) is None:
+            assignment_id = index.add(h, full=full)
+            base_id = None if full else ids[base_ref]
+            new_rows.append((assignment_id, value, base_id, h))
+        ids.append(assignment_id)
+
+    db.executemany('INSERT INTO assignment (id, value, base_id, hash) '
+                   'VALUES                 ( ?,     ?,       ?,    ?)',
+                   new_rows)
+    return ids
+
 
+def insert_datapoints(db, assignment_index, method_id, instance_id, run_id, trial, data_file):
+    assignment_ids = insert_assignments(db, assignment_index, data_file.assignments)
+
+    def gen():
+        for iteration, row in enumerate(data_file.rows):
+            ref = row[3]
+            assignment_id = assignment_ids[ref] if ref is not None else None
             yield (run_id, method_id, instance_id, trial, iteration,
-                   dp['time'], dp['value'], dp['bound'], assignment_id)
+                   *row[:3], assignment_id)
 
     db.executemany('INSERT INTO output (run_id, method_id, instance_id, trial, '
                    '                    iteration, time, value, bound, '
@@ -102,22 +312,74 @@ def insert_datapoints(db, method_id, instance_id, run_id, trial, datapoints):
 
 
 def execute(args):
+    filenames = list(find_data_files(args.paths))
+
+    append = args.append_to_run is not None
+
     with gmbench.db.connect() as db:
-        with db:
-            hardware_id = fetch_hardware_id(db, args.hardware)
-            run_id = insert_run(db, args.date, hardware_id)
-
-            for filename in find_data_files(args.paths):
-                print(f'Processing file “{filename}”...')
-                data = parse_data_file(filename)
-                method = data['method']
-                dataset = data['dataset']
-                trial = data['trial']
-                instance = dataset + str(data['instance'])
-
-                method_id = fetch_method_id(db, method)
-                instance_id = fetch_instance_id(db, dataset, instance)
-                insert_datapoints(db, method_id, instance_id, run_id, trial,
-                                  data['datapoints'])
-
-        print(f'Run {run_id} imported successfully.')
+        if gmbench.db.assignment_format(db) != 'packed':
+            print('Error: Assignments are stored in the old JSON format, '
+                  'run `migrate-assignments` first', file=sys.stderr)
+            sys.exit(1)
+
+        # The indexes of `output` are needed for replacing trials of an
+        # existing run, so we only drop them when importing a new run.
+        tables = ('output', 'assignment', 'import_manifest', 'output_dirty')
+        with gmbench.db.bulk_load(db, tables, drop_indexes=not append):
+            if append:
+                run_id = check_run_id(db, args.append_to_run)
+                if gmbench.archive.is_archived(db, run_id):
+                    print(f'Error: Run {run_id} is archived, run `restore-run` first',
+                          file=sys.stderr)
+                    sys.exit(1)
+                manifest = fetch_manifest(db, run_id)
+            else:
+                hardware_id = fetch_hardware_id(db, args.hardware)
+                run_id = insert_run(db, args.date, hardware_id)
+                manifest = {}
+            gmbench.db.bump_data_version(db)
+
+            # Files with the same size and modification time as recorded in
+            # the manifest are skipped right away. For all other files we
+            # compare the content hash after parsing.
+            counts = collections.Counter(imported=0, replaced=0, unchanged=0)
+            changed_filenames = []
+            for filename in filenames:
+                if (entry := manifest.get(filename)) and entry[0] == stat_file(filename):
+                    counts['unchanged'] += 1
+                else:
+                    changed_filenames.append(filename)
+            total = len(changed_filenames)
+
+            assignment_index = gmbench.assignment.Index(db)
+            method_ids, instance_ids = {}, {}
+            time_last = time.monotonic()
+            for i, data_file in enumerate(load_data_files(changed_filenames, args.jobs)):
+                if (method_id := method_ids.get(data_file.method)) is None:
+                    method_id = fetch_method_id(db, data_file.method)
+                    method_ids[data_file.method] = method_id
+
+                key = data_file.dataset, data_file.instance
+                if (instance_id := instance_ids.get(key)) is None:
+                    instance_id = fetch_instance_id(db, *key)
+                    instance_ids[key] = instance_id
+
+                if (entry := manifest.get(data_file.filename)) and entry[1] == data_file.hash:
+                    counts['unchanged'] += 1
+                else:
+                    if append and delete_trial(db, run_id, method_id, instance_id, data_file.trial):
+                        counts['replaced'] += 1
+                    else:
+                        counts['imported'] += 1
+                    insert_datapoints(db, assignment_index, method_id, instance_id,
+                                      run_id, data_file.trial, data_file)
+                    gmbench.db.mark_dirty(db, run_id, method_id, instance_id)
+
+                update_manifest(db, run_id, method_id, instance_id, data_file)
+
+                if time.monotonic() - time_last >= 10:
+                    print(f'Progress: {i + 1} / {total} files ({(i + 1) / total * 100:.2f}%)')
+                    time_last = time.monotonic()
+
+        print(f'Run {run_id} imported successfully ({counts["imported"]} files imported, '
+              f'{counts["replaced"]} replaced, {counts["unchanged"]} unchanged).')
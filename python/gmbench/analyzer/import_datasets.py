@@ -89,6 +89,7 @@ def find_dataset_instances(path):
 def execute(args):
     with gmbench.db.connect() as db:
         with db:
+            gmbench.db.bump_data_version(db)
             for path in args.paths:
                 for result in find_dataset_instances(path):
                     insert(db, *result)
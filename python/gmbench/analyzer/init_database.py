@@ -18,6 +18,7 @@ def execute(args):
             os.remove(gmbench.db.DB_FILE)
 
     with gmbench.db.connect(execute_schema=False) as db:
+        gmbench.db.migrate_schema(db)
         with db:
             # Delete all views as they can be recreated without data loss.
             cur = db.execute("SELECT name FROM sqlite_master WHERE type='view'")
@@ -25,3 +26,4 @@ def execute(args):
                 db.execute(f"DROP VIEW {row['name']}")
 
             cur.executescript(gmbench.db.DB_SCHEMA)
+            gmbench.db.create_indexes(db)
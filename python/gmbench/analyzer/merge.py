@@ -0,0 +1,39 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import sys
+
+import gmbench.archive
+import gmbench.db
+import gmbench.merge
+
+
+def init_subparser(subparsers):
+    parser = subparsers.add_parser('merge')
+    parser.add_argument('--append-to-run', '-a', type=int, metavar='RUN',
+                        help='Merge all runs of the source databases into this run')
+    parser.add_argument('sources', metavar='DATABASE', nargs='+',
+                        help='Database to merge into the current one')
+    return parser
+
+
+def execute(args):
+    with gmbench.db.connect() as db:
+        if (run_id := args.append_to_run) is not None:
+            if not db.execute('SELECT 1 FROM run WHERE id = ?', (run_id,)).fetchone():
+                print('Error: Unknown run', run_id, file=sys.stderr)
+                sys.exit(1)
+            if gmbench.archive.is_archived(db, run_id):
+                print(f'Error: Run {run_id} is archived, run `restore-run` first',
+                      file=sys.stderr)
+                sys.exit(1)
+
+        for filename in args.sources:
+            try:
+                output_rows, new_assignments, total_assignments = \
+                    gmbench.merge.merge(db, filename, run_id)
+            except gmbench.merge.MergeError as e:
+                print(f'Error: {filename}: {e}', file=sys.stderr)
+                sys.exit(1)
+
+            print(f'Merged {filename} ({output_rows} output rows, {new_assignments} of '
+                  f'{total_assignments} assignments new).')
@@ -0,0 +1,23 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import gmbench.db
+
+
+def init_subparser(subparsers):
+    parser = subparsers.add_parser('migrate-assignments')
+    return parser
+
+
+def execute(args):
+    with gmbench.db.connect() as db:
+        if gmbench.db.assignment_format(db) == 'packed':
+            print('Table assignment already uses the packed format.')
+            return
+
+        size_before = gmbench.db.database_size(db)
+        gmbench.db.migrate_assignments(db)
+        db.execute('VACUUM')
+        size_after = gmbench.db.database_size(db)
+
+        print(f'Table assignment migrated to the packed format '
+              f'(database size {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB).')
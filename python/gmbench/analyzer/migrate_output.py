@@ -0,0 +1,26 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import gmbench.db
+
+
+def init_subparser(subparsers):
+    parser = subparsers.add_parser('migrate-output')
+    parser.add_argument('--layout', '-l', choices=tuple(gmbench.db.OUTPUT_LAYOUTS),
+                        default='clustered',
+                        help='Storage layout of the output table (default: clustered)')
+    return parser
+
+
+def execute(args):
+    with gmbench.db.connect() as db:
+        if gmbench.db.output_layout(db) == args.layout:
+            print(f'Table output already uses the {args.layout} layout.')
+            return
+
+        size_before = gmbench.db.database_size(db)
+        gmbench.db.migrate_output(db, args.layout)
+        db.execute('VACUUM')
+        size_after = gmbench.db.database_size(db)
+
+        print(f'Table output migrated to the {args.layout} layout '
+              f'(database size {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB).')
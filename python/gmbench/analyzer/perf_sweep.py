@@ -0,0 +1,56 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import sys
+
+import gmbench.db
+import gmbench.perf
+
+
+def parse_list(s):
+    return tuple(float(x) for x in s.split(','))
+
+
+def init_subparser(subparsers):
+    parser = subparsers.add_parser('perf-sweep')
+    parser.add_argument('--run', '-r', type=int, required=True)
+    parser.add_argument('--dataset', '-d')
+    parser.add_argument('--optimality-tolerances', '-t', metavar='T1,T2,...', type=parse_list,
+                        default=(gmbench.perf.DEFAULT_OPTIMALITY_TOLERANCE,),
+                        help='Optimality tolerances in percent (default: %(default)s)')
+    parser.add_argument('--min-runtimes', '-m', metavar='T1,T2,...', type=parse_list,
+                        default=(gmbench.perf.DEFAULT_MIN_RUNTIME,),
+                        help='Minimal runtimes in seconds (default: %(default)s)')
+    parser.add_argument('--max-perf-ratio', '-M', type=float)
+    parser.add_argument('--profiles', '-p', action='store_true',
+                        help='Print every point of the profiles instead of only the areas')
+    return parser
+
+
+def execute(args):
+    with gmbench.db.connect(readonly=True) as db:
+        with db:
+            dataset_id = None
+            if args.dataset:
+                cur = db.execute('SELECT id FROM dataset WHERE name = ?', (args.dataset,))
+                if (row := cur.fetchone()) is None:
+                    print(f'Error: Unknown dataset {args.dataset}', file=sys.stderr)
+                    sys.exit(1)
+                dataset_id, = row
+
+            rows = gmbench.perf.compute_performance_sweep(db, args.run,
+                                                          args.optimality_tolerances,
+                                                          args.min_runtimes,
+                                                          dataset_id=dataset_id,
+                                                          max_perf_ratio=args.max_perf_ratio)
+
+    if args.profiles:
+        print('optimality_tolerance\tmin_runtime\tmethod\tarea\tperf_ratio\tsolved')
+        for row in rows:
+            for x, y in zip(row.x, row.y):
+                print(f'{row.optimality_tolerance:g}\t{row.min_runtime:g}\t{row.method}\t'
+                      f'{row.area:.6g}\t{x:.6g}\t{y:.6g}')
+    else:
+        print('optimality_tolerance\tmin_runtime\tmethod\tarea')
+        for row in rows:
+            print(f'{row.optimality_tolerance:g}\t{row.min_runtime:g}\t{row.method}\t'
+                  f'{row.area:.6g}')
@@ -0,0 +1,77 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import sys
+
+import matplotlib.pyplot as plt
+import numpy
+
+import gmbench.anytime
+import gmbench.db
+
+
+def init_subparser(subparsers):
+    parser = subparsers.add_parser('plot-anytime')
+    parser.add_argument('--run', '-r', type=int, required=True)
+    parser.add_argument('--dataset', '-d', required=True)
+    parser.add_argument('--instance', '-i',
+                        help='Plot the values of this instance instead of the average '
+                             'over the dataset (missing where a method has no solution '
+                             'for some instance)')
+    parser.add_argument('--method', '-m', action='append', dest='methods',
+                        help='Only plot this method (can be given multiple times)')
+    parser.add_argument('--log-times', '-L', metavar='START,STOP,NUM', default='0.01,1000,100',
+                        help='Logarithmically spaced times (default: %(default)s)')
+    parser.add_argument('--logscale', '-l', action='store_true')
+    parser.add_argument('--output', '-o')
+    return parser
+
+
+def execute(args):
+    with gmbench.db.connect(readonly=True) as db:
+        with db:
+            try:
+                dataset_id, = gmbench.anytime.lookup_ids(db, 'dataset', [args.dataset])
+                method_ids = None
+                if args.methods:
+                    method_ids = gmbench.anytime.lookup_ids(db, 'method', args.methods)
+            except gmbench.anytime.AnytimeError as e:
+                print(f'Error: {e}', file=sys.stderr)
+                sys.exit(1)
+
+            start, stop, num = args.log_times.split(',')
+            times = gmbench.anytime.log_times(float(start), float(stop), int(num))
+            state = gmbench.anytime.compute_state(db, args.run, times,
+                                                  dataset_id=dataset_id,
+                                                  method_ids=method_ids)
+
+            rows = numpy.ones(len(state.instance_ids), dtype=bool)
+            if args.instance:
+                cur = db.execute('SELECT id FROM instance WHERE dataset_id = ? AND name = ?',
+                                 (dataset_id, args.instance))
+                if (row := cur.fetchone()) is None:
+                    print(f'Error: Unknown instance {args.instance}', file=sys.stderr)
+                    sys.exit(1)
+                rows = state.instance_ids == row[0]
+
+            methods = dict(db.execute('SELECT id, name FROM method').fetchall())
+
+    plt.figure()
+    plt.title(f'{args.dataset}/{args.instance}' if args.instance else args.dataset)
+    plt.xlabel('time (s)')
+    plt.ylabel('value' if args.instance else 'average value')
+
+    for method_id in sorted(numpy.unique(state.method_ids[rows]), key=lambda i: methods[i]):
+        value = state.value[rows & (state.method_ids == method_id)].mean(axis=0)
+        # Values are infinite as long as some instance has no solution.
+        value[numpy.isinf(value)] = numpy.nan
+        plt.step(state.times, value, where='post', label=methods[method_id])
+
+    if args.logscale:
+        plt.xscale('log')
+    plt.grid(color='#888888', linestyle=':')
+    plt.legend()
+
+    if args.output:
+        plt.savefig(args.output)
+    else:
+        plt.show()
@@ -3,6 +3,7 @@
 import matplotlib.pyplot as plt
 
 import gmbench.db
+import gmbench.perf
 
 FIXED_COLORS = {
     'fm-bca':   'C0',
@@ -19,70 +20,9 @@ FIXED_COLORS = {
 }
 
 
-SQL_QUERY = '''
-    WITH
-        best_observed AS (
-            SELECT instance_id, min(value) AS value
-            FROM output_postprocessed
-            WHERE run_id = :run_id
-            GROUP BY instance_id),
-        best_known AS (
-            SELECT id AS instance_id, optimum AS value
-            FROM instance
-            WHERE optimum IS NOT NULL),
-        best_union AS (
-            SELECT * FROM best_observed
-            UNION ALL
-            SELECT * FROM best_known),
-        best AS (
-            SELECT instance_id, max(value) AS value
-            FROM best_union
-            GROUP BY instance_id),
-        opt_per_instance AS (
-            SELECT
-                output.run_id,
-                output.method_id,
-                output.instance_id,
-                CASE WHEN min(output.time) < :min_runtime THEN :min_runtime
-                     ELSE min(output.time)
-                END AS time
-            FROM output_postprocessed AS output
-            INNER JOIN instance ON instance.id = output.instance_id
-            INNER JOIN best ON best.instance_id = output.instance_id
-            WHERE output.run_id = :run_id
-              AND output.value <= best.value + :optimality_tolerance * abs(best.value)
-              AND (:dataset_id IS NULL OR instance.dataset_id = :dataset_id)
-            GROUP BY output.run_id, output.method_id, output.instance_id),
-        best_opt_per_instance AS (
-            SELECT run_id, instance_id, min(time) AS time
-            FROM opt_per_instance AS opt
-            GROUP BY opt.run_id, opt.instance_id),
-        perf_ratio AS (
-            SELECT
-                opt.run_id,
-                opt.method_id,
-                opt.instance_id,
-                opt.time / best_opt.time AS perf_ratio
-            FROM opt_per_instance AS opt
-            INNER JOIN best_opt_per_instance AS best_opt ON best_opt.run_id = opt.run_id
-                                                        AND best_opt.instance_id = opt.instance_id
-            WHERE opt.time / best_opt.time IS NOT NULL)
-    SELECT
-        method.name             AS method,
-        perf_ratio.perf_ratio   AS perf_ratio,
-        row_number() OVER win   AS instances
-    FROM perf_ratio
-    INNER JOIN method ON method.id = perf_ratio.method_id
-    WHERE (:max_perf_ratio IS NULL OR perf_ratio.perf_ratio < :max_perf_ratio)
-    WINDOW win AS (PARTITION BY perf_ratio.method_id
-                   ORDER BY perf_ratio.perf_ratio
-                   ROWS UNBOUNDED PRECEDING)
-'''
-
-
 def init_subparser(subparsers):
     parser = subparsers.add_parser('plot-perf')
-    parser.add_argument('--run', '-r', required=True)
+    parser.add_argument('--run', '-r', type=int, required=True)
     parser.add_argument('--dataset', '-d')
     parser.add_argument('--min-runtime', '-m', type=float)
     parser.add_argument('--optimality-tolerance', '-t', type=float, default=0)
@@ -125,7 +65,7 @@ def make_rectangular(method_data):
 
 
 def execute(args):
-    with gmbench.db.connect() as db:
+    with gmbench.db.connect(readonly=True) as db:
         with db:
             dataset_id = None
             if args.dataset:
@@ -133,26 +73,12 @@ def execute(args):
                                  (args.dataset,))
                 dataset_id, = cur.fetchone()
 
-            cur = db.execute('SELECT count(*) FROM instance '
-                             'WHERE :dataset_id IS NULL OR dataset_id = :dataset_id',
-                             {'dataset_id': dataset_id})
-            total, = cur.fetchone()
-
-            cur = db.execute(SQL_QUERY, {'run_id': args.run,
-                                         'dataset_id': dataset_id,
-                                         'min_runtime': args.min_runtime,
-                                         'optimality_tolerance': args.optimality_tolerance / 100.0,
-                                         'max_perf_ratio': args.max_perf_ratio})
-
-
-            # Fetch data from database.
-            data = {}
-            for row in cur:
-                method = row['method']
-                if not method in data:
-                    data[method] = {'method': method, 'x': [], 'y': []}
-                data[method]['x'].append(row['perf_ratio'])
-                data[method]['y'].append(row['instances'] / total * 100)
+            data, = gmbench.perf.compute_profiles_for_datasets(db, args.run, [dataset_id],
+                                                               args.max_perf_ratio,
+                                                               args.min_runtime,
+                                                               args.optimality_tolerance)
+            for method, method_data in data.items():
+                method_data['method'] = method
 
             # Ensure that data points start and end at the roughly the same
             # position in x space.
@@ -1,59 +1,171 @@
 # Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
 
+import functools
 import json
 import math
+import multiprocessing
 import time
 import types
+from collections import namedtuple
 
+import numpy
+
+import gmbench.assignment
+import gmbench.checkpoint
 import gmbench.db
+import gmbench.summary
+
+
+# Number of shards per worker process for `--jobs`. More shards give a better
+# load balance, fewer shards less overhead per query.
+SHARDS_PER_JOB = 16
+
+# Number of `(assignment_id, instance_id)` pairs for which the accuracies are
+# cached. The same assignment is often found by several trials and methods.
+ACCURACY_CACHE_SIZE = 4096
+
+# Groundtruth of an instance in a form suitable for vectorized evaluation. For
+# each node the groundtruth lists the acceptable labels (or nothing if the node
+# is not known). `nodes` and `labels` are the flattened pairs of both.
+Groundtruth = namedtuple('Groundtruth', 'num_nodes num_known nodes labels')
 
 
 def init_subparser(subparsers):
-    return subparsers.add_parser('postprocess')
+    parser = subparsers.add_parser('postprocess')
+    parser.add_argument('--full', action='store_true',
+                        help='Recompute all groups, not only the ones modified since the last run')
+    parser.add_argument('--jobs', '-j', type=int,
+                        help='Number of worker processes (default: number of CPUs)')
+    return parser
+
+
+def parse_groundtruth(value):
+    if not value or not (groundtruth := json.loads(value)):
+        return None
+
+    nodes, labels = [], []
+    for node, acceptable_labels in enumerate(groundtruth):
+        if acceptable_labels:
+            nodes.extend(node for label in acceptable_labels)
+            labels.extend(acceptable_labels)
+
+    return Groundtruth(num_nodes=len(groundtruth),
+                       num_known=sum(1 for x in groundtruth if x),
+                       nodes=numpy.array(nodes, dtype=numpy.int64),
+                       labels=numpy.array(labels, dtype=numpy.int64))
 
 
 def accuracy(assignment, groundtruth, known_nodes_only=True):
-    if not groundtruth:
+    if groundtruth is None:
         return None
 
-    if not assignment:
+    if assignment is None or not len(assignment):
         return 0.0
 
-    #assert len(assignment) == len(groundtruth)
-    assert len(assignment) >= len(groundtruth)
-
-    correct, total = 0, 0
-    for a, g in zip(assignment, groundtruth):
-        if g or not known_nodes_only:
-            total += 1
+    #assert len(assignment) == groundtruth.num_nodes
+    assert len(assignment) >= groundtruth.num_nodes
 
-        if g and a in g:
-            correct += 1
+    # A node can have multiple acceptable labels, so we count the nodes with
+    # at least one matching label.
+    assignment = numpy.asarray(assignment)
+    matches = assignment[groundtruth.nodes] == groundtruth.labels
+    correct = numpy.unique(groundtruth.nodes[matches]).size
 
+    total = groundtruth.num_known if known_nodes_only else groundtruth.num_nodes
     return correct / total
 
 
-def fetch_postprocessed_output(db, progress_handler=None):
-    cur = db.execute('SELECT count(*) FROM output')
+def output_filter(dirty_only=False, shard=None):
+    # Returns the SQL clauses (join and where) that restrict the `output` rows
+    # to the groups listed in `output_dirty` and/or to the groups between the
+    # first and last group (inclusive) of the shard.
+    join, where = '', 'WHERE 1 '
+    if dirty_only:
+        join = ('INNER JOIN output_dirty AS dirty ON dirty.run_id = output.run_id '
+                '                                AND dirty.method_id = output.method_id '
+                '                                AND dirty.instance_id = output.instance_id ')
+    if shard is not None:
+        where += ('AND (output.run_id, output.method_id, output.instance_id) '
+                  '    BETWEEN (:first_run_id, :first_method_id, :first_instance_id) '
+                  '        AND (:last_run_id, :last_method_id, :last_instance_id) ')
+    return join, where
+
+
+def shard_parameters(shard):
+    first, last = shard
+    return {'first_run_id': first[0], 'first_method_id': first[1], 'first_instance_id': first[2],
+            'last_run_id': last[0], 'last_method_id': last[1], 'last_instance_id': last[2]}
+
+
+def compute_shards(db, num_shards, dirty_only=False):
+    """Splits the groups into about `num_shards` ranges with similar row count.
+
+    Each shard is a tuple `(first_group, last_group)` of consecutive groups in
+    the order of `(run_id, method_id, instance_id)`.
+    """
+    join, where = output_filter(dirty_only)
+    cur = db.execute('SELECT output.run_id, output.method_id, output.instance_id, count(*) '
+                     'FROM output ' + join + where +
+                     'GROUP BY output.run_id, output.method_id, output.instance_id '
+                     'ORDER BY output.run_id, output.method_id, output.instance_id')
+    groups = [(tuple(row[:3]), row[3]) for row in cur]
+
+    total = sum(count for group, count in groups)
+    shards, first, rows = [], None, 0
+    for group, count in groups:
+        if first is None:
+            first = group
+        rows += count
+        if rows * num_shards >= total * (len(shards) + 1):
+            shards.append((first, group))
+            first = None
+    if first is not None:
+        shards.append((first, groups[-1][0]))
+    return shards
+
+
+def fetch_postprocessed_output(db, progress_handler=None, dirty_only=False, shard=None):
+    # If `dirty_only` is set, only the groups listed in `output_dirty` are
+    # processed. If `shard` is set, only the groups of this shard are processed
+    # (see `compute_shards`).
+    join, where = output_filter(dirty_only, shard)
+    params = shard_parameters(shard) if shard is not None else {}
+
+    cur = db.execute('SELECT count(*) FROM output ' + join + where, params)
     total, = cur.fetchone()
 
-    cur = db.execute('SELECT output.id AS output_id, output.run_id, output.method_id, '
+    # Assignments and groundtruth are large, so they are not part of the query
+    # but are fetched (and cached) only when needed.
+    cur = db.execute('SELECT output.run_id, output.method_id, '
                      '       output.instance_id, output.time, output.value, '
-                     '       output.bound, assignment.id AS assignment_id, '
-                     '       assignment.value AS assignment, instance.groundtruth '
-                     'FROM output '
-                     'INNER JOIN instance ON instance.id = output.instance_id '
-                     'LEFT OUTER JOIN assignment ON assignment.id = output.assignment_id '
+                     '       output.bound, output.assignment_id '
+                     'FROM output ' + join + where +
                      'ORDER BY output.run_id, output.method_id, '
-                     '         output.instance_id, output.time')
+                     '         output.instance_id, output.time',
+                     params)
 
     coalesce = lambda a, b: a if a is not None else b
+    decoder = gmbench.assignment.Decoder(db)
+
+    @functools.lru_cache(None)
+    def fetch_groundtruth(instance_id):
+        cur = db.execute('SELECT groundtruth FROM instance WHERE id = ?', (instance_id,))
+        return parse_groundtruth(cur.fetchone()[0])
+
+    @functools.lru_cache(ACCURACY_CACHE_SIZE)
+    def accuracies(assignment_id, instance_id):
+        groundtruth = fetch_groundtruth(instance_id)
+        if groundtruth is None or assignment_id is None:
+            assignment = None
+        else:
+            assignment = decoder.fetch_array(assignment_id)
+        return (accuracy(assignment, groundtruth, known_nodes_only=False),
+                accuracy(assignment, groundtruth, known_nodes_only=True))
 
     def new_state():
         state = types.SimpleNamespace()
         state.last_group = None
         state.best_value = math.inf
-        state.best_assignment = None
         state.best_assignment_id = None
         state.best_bound = -math.inf
         return state
@@ -79,19 +191,10 @@ def fetch_postprocessed_output(db, progress_handler=None):
             state.best_value = curr_value
             state.best_assignment_id = row['assignment_id']
 
-            if a := row['assignment']:
-                state.best_assignment = json.loads(a)
-            else:
-                state.best_assignment = None
-
         if bound_improved:
             state.best_bound = curr_bound
 
         if (group_changed or value_improved or bound_improved):
-            groundtruth = row['groundtruth']
-            if groundtruth:
-                groundtruth = json.loads(groundtruth)
-
             yield (row['run_id'],
                    row['method_id'],
                    row['instance_id'],
@@ -99,12 +202,30 @@ def fetch_postprocessed_output(db, progress_handler=None):
                    state.best_value,
                    state.best_bound,
                    state.best_assignment_id,
-                   accuracy(state.best_assignment, groundtruth, known_nodes_only=False),
-                   accuracy(state.best_assignment, groundtruth, known_nodes_only=True))
+                   *accuracies(state.best_assignment_id, row['instance_id']))
 
         state.last_group = curr_group
 
 
+def process_shard(shard, dirty_only):
+    # Runs in a worker process with its own read-only connection. The rows are
+    # sent back to the main process, which is the only writer.
+    with gmbench.db.connect(readonly=True) as db:
+        return list(fetch_postprocessed_output(db, dirty_only=dirty_only, shard=shard))
+
+
+def fetch_postprocessed_output_parallel(db, jobs=None, progress_handler=None, dirty_only=False):
+    # Groups are independent of each other, so we split them into shards that
+    # are processed by a pool of workers. The results are yielded in order.
+    with multiprocessing.Pool(jobs) as pool:
+        shards = compute_shards(db, pool._processes * SHARDS_PER_JOB, dirty_only)
+        worker = functools.partial(process_shard, dirty_only=dirty_only)
+        for i, rows in enumerate(pool.imap(worker, shards)):
+            if progress_handler is not None:
+                progress_handler(i, len(shards))
+            yield from rows
+
+
 def insert_postprocessed_output(db, rows):
     db.executemany('INSERT INTO output_postprocessed ('
                    '    run_id, method_id, instance_id, time, value, bound, '
@@ -119,12 +240,41 @@ def execute(args):
         nonlocal time_last
         time_current = time.monotonic()
         if time_current - time_last >= 10:
-            print(f'Progress: {current} / {total} rows ({current / total * 100:.2f}%)')
+            print(f'Progress: {current} / {total} ({current / total * 100:.2f}%)')
             time_last = time_current
 
     with gmbench.db.connect() as db:
-        with db:
-            db.execute('DELETE FROM output_postprocessed')
-            rows = fetch_postprocessed_output(db, progress_handler)
+        # Only the groups that have been modified since the last run are
+        # recomputed, unless there is nothing to start from.
+        cur = db.execute('SELECT EXISTS (SELECT * FROM output_postprocessed)')
+        full, = cur.fetchone()
+        full = args.full or not full
+
+        tables = ('output_postprocessed', 'output_checkpointed', 'benchmark_per_dataset')
+        with gmbench.db.bulk_load(db, tables, drop_indexes=full):
+            if full:
+                # The `output` rows of archived runs are not available.
+                db.execute('DELETE FROM output_postprocessed '
+                           'WHERE run_id NOT IN (SELECT run_id FROM archive)')
+            else:
+                cur = db.execute('SELECT count(*) FROM output_dirty')
+                print(f'Recomputing {cur.fetchone()[0]} modified groups.')
+                db.execute('DELETE FROM output_postprocessed '
+                           'WHERE (run_id, method_id, instance_id) IN '
+                           '    (SELECT run_id, method_id, instance_id FROM output_dirty)')
+            if args.jobs == 1:
+                rows = fetch_postprocessed_output(db, progress_handler, dirty_only=not full)
+            else:
+                rows = fetch_postprocessed_output_parallel(db, args.jobs, progress_handler,
+                                                           dirty_only=not full)
             insert_postprocessed_output(db, rows)
+
+            print('Updating checkpoints.')
+            gmbench.checkpoint.update(db, dirty_only=not full)
+            gmbench.checkpoint.refresh(db)
+            db.execute('DELETE FROM output_dirty')
+
+            print('Updating summary tables.')
+            gmbench.db.bump_data_version(db)
+            gmbench.summary.build(db)
             print('Done.')
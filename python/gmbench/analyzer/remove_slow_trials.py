@@ -16,7 +16,7 @@ WITH
                instance.id AS instance_id,
                instance.name AS instance,
                trial.trial AS trial,
-               count(output.id) > 0 AS present
+               count(output.run_id) > 0 AS present
         FROM trial, method, instance
         INNER JOIN dataset ON dataset.id = instance.dataset_id
         LEFT OUTER JOIN output ON output.method_id = method.id
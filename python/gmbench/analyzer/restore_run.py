@@ -0,0 +1,24 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import sys
+
+import gmbench.archive
+import gmbench.db
+
+
+def init_subparser(subparsers):
+    parser = subparsers.add_parser('restore-run')
+    parser.add_argument('--run', '-r', type=int, required=True)
+    return parser
+
+
+def execute(args):
+    with gmbench.db.connect() as db:
+        try:
+            num_rows, num_assignments = gmbench.archive.restore_run(db, args.run)
+        except gmbench.archive.ArchiveError as e:
+            print(f'Error: {e}', file=sys.stderr)
+            sys.exit(1)
+
+        print(f'Run {args.run} restored ({num_rows} output rows, '
+              f'{num_assignments} assignments).')
@@ -13,7 +13,7 @@ def init_subparser(subparsers):
 
 
 def execute(args):
-    with gmbench.db.connect() as db:
+    with gmbench.db.connect(readonly=True) as db:
         with db:
             ok, errors = gmbench.verification.missing_instance_in_run(db, args.run)
             if not ok:
@@ -1,10 +1,10 @@
 # Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
 
-import json
 import multiprocessing
 import sys
 import time
 
+import gmbench.assignment
 import gmbench.db
 import gmbench.verification
 
@@ -17,7 +17,8 @@ SQL = '''
         output.run_id       AS run_id,
         output.time         AS time,
         output.value        AS value,
-        assignment.value    AS assignment
+        assignment.value    AS assignment,
+        assignment.base_id  AS assignment_base_id
     FROM output_postprocessed AS output
     INNER JOIN method ON method.id = output.method_id
     INNER JOIN instance ON instance.id = output.instance_id
@@ -58,7 +59,7 @@ def worker_main(args, in_queue):
                 model = mpopt.qap.parse_dd_model(f)
             old_filename = filename
 
-        assignment = preprocess_assignment(model, json.loads(row['assignment']))
+        assignment = preprocess_assignment(model, row['assignment'])
         primals = mpopt.qap.Primals(model, assignment)
         assert primals.check_consistency()
 
@@ -72,12 +73,13 @@ def execute(args):
     import mpopt.qap
     import mpopt.utils
 
-    with gmbench.db.connect() as db:
+    with gmbench.db.connect(readonly=True) as db:
         with db:
             cur = db.execute(SQL_COUNT, {'run_id': args.run})
             total = cur.fetchone()[0]
 
             cur = db.execute(SQL, {'run_id': args.run})
+            decoder = gmbench.assignment.Decoder(db)
 
             # We can not use Pool.imap_unordered, because the Pool would consume
             # the iterator in a separate thread. However, the sqlite database
@@ -87,7 +89,12 @@ def execute(args):
             with multiprocessing.Pool(None, worker_main, (args, in_queue)) as pool:
                 tick = time.monotonic()
                 for i, row in enumerate(cur):
-                    in_queue.put(dict(row))
+                    # Delta-encoded assignments need access to the database
+                    # for decoding, so we decode them before queuing.
+                    row = dict(row)
+                    row['assignment'] = decoder.decode(row['assignment'],
+                                                       row.pop('assignment_base_id'))
+                    in_queue.put(row)
 
                     if time.monotonic() - tick > 60:
                         print(f'Progress: {i} / {total} ({i / total * 100:.2f}%)')
@@ -0,0 +1,90 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+from collections import namedtuple
+
+import numpy
+
+import gmbench.cache
+import gmbench.perf
+
+# The rows of each (run, method, instance) group in `output_postprocessed` form
+# a step function over time: The state at time `t` is the last row at or
+# before `t`. The `output_checkpointed` table materializes these states only
+# for the times of the `checkpoint` table. This module evaluates the step
+# functions for arbitrary times with a binary search over each group's rows in
+# the columnar cache (see `gmbench.cache`), so dense time grids are cheap.
+
+# State of each group (rows) at each time (columns). Before the first row of a
+# group the value is inf, the bound -inf and the accuracies NaN. `optimal` is
+# NaN if the optimum of the instance is unknown.
+AnytimeState = namedtuple('AnytimeState', 'method_ids instance_ids times value bound optimal '
+                                          'accuracy_all_nodes accuracy_known_nodes')
+
+
+class AnytimeError(Exception):
+    pass
+
+
+def lookup_ids(db, table, names):
+    """Returns the ids of the datasets or methods with the given names."""
+    ids = []
+    for name in names:
+        cur = db.execute(f'SELECT id FROM {table} WHERE name = ?', (name,))
+        if (row := cur.fetchone()) is None:
+            raise AnytimeError(f'Unknown {table} {name}')
+        ids.append(row[0])
+    return ids
+
+
+def log_times(start, stop, num):
+    """Returns `num` logarithmically spaced times from `start` to `stop`."""
+    return numpy.geomspace(start, stop, num)
+
+
+def compute_state(db, run_id, times, dataset_id=None, method_ids=None,
+                  optimality_tolerance=None):
+    """Returns the `AnytimeState` of the run's groups at the given times.
+
+    Only the groups of the dataset and methods are returned, if given.
+    """
+    if optimality_tolerance is None:
+        optimality_tolerance = gmbench.perf.DEFAULT_OPTIMALITY_TOLERANCE
+
+    output = gmbench.cache.select_run(gmbench.cache.ensure(db), run_id)
+    instances = gmbench.perf.fetch_instances(db)
+    instance_index = numpy.searchsorted(instances.ids, output.group_instance_id)
+
+    groups = numpy.ones(len(instance_index), dtype=bool)
+    if dataset_id is not None:
+        groups &= instances.dataset_ids[instance_index] == dataset_id
+    if method_ids is not None:
+        groups &= numpy.isin(output.group_method_id, method_ids)
+
+    times = numpy.asarray(times, dtype=numpy.float64)
+    starts = output.group_offsets[:-1]
+    queries = numpy.broadcast_to(times, (len(starts), len(times)))
+    index = gmbench.cache.searchsorted_groups(output.group_offsets, output.time, queries,
+                                              side='right') - 1
+    index, starts = index[groups], starts[groups]
+    started = index >= starts[:, None]
+    index = numpy.where(started, index, 0)
+
+    def column(values, default):
+        if not len(values):
+            return numpy.full(index.shape, default)
+        return numpy.where(started, values[index], default)
+
+    value = column(output.value, numpy.inf)
+    optimum = instances.optima[instance_index[groups]][:, None]
+    optimal = numpy.where(numpy.isnan(optimum), numpy.nan,
+                          value <= optimum + optimality_tolerance / 100.0 * numpy.abs(optimum))
+
+    return AnytimeState(method_ids=output.group_method_id[groups],
+                        instance_ids=output.group_instance_id[groups],
+                        times=times,
+                        value=value,
+                        bound=column(output.bound, -numpy.inf),
+                        optimal=optimal,
+                        accuracy_all_nodes=column(output.accuracy_all_nodes, numpy.nan),
+                        accuracy_known_nodes=column(output.accuracy_known_nodes, numpy.nan))
+
@@ -0,0 +1,213 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import os
+import os.path
+
+import gmbench.assignment
+import gmbench.db
+
+# The raw `output` rows of a run that has been postprocessed and verified are
+# rarely needed. They can be moved into a separate archive database next to
+# the main database, together with the assignments that are not referenced by
+# anything else. Everything derived from them (`output_postprocessed` and the
+# tables built from it) stays in the main database. Archived runs are listed
+# in the `archive` table and their archives are attached on
+# `gmbench.db.connect` (see `gmbench.db.attach_archives`).
+
+ARCHIVE_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS {schema}.output (
+        run_id INTEGER NOT NULL,
+        method_id INTEGER NOT NULL,
+        instance_id INTEGER NOT NULL,
+        trial INTEGER NOT NULL,
+        iteration INTEGER NOT NULL,
+        time REAL NOT NULL,
+        value REAL NOT NULL,
+        bound REAL NOT NULL,
+        assignment_id INTEGER,
+        PRIMARY KEY(run_id, method_id, instance_id, trial, iteration))
+        WITHOUT ROWID''',
+
+    '''CREATE TABLE IF NOT EXISTS {schema}.assignment (
+        id INTEGER PRIMARY KEY,
+        value BLOB NOT NULL,
+        base_id INTEGER,
+        hash INTEGER)''',
+)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_filename(run_id):
+    name, ext = os.path.splitext(os.path.basename(gmbench.db.DB_FILE))
+    return f'{name}-run{run_id}{ext}'
+
+
+def is_archived(db, run_id):
+    cur = db.execute('SELECT 1 FROM archive WHERE run_id = ?', (run_id,))
+    return cur.fetchone() is not None
+
+
+def select_archived_assignments(others):
+    # Assignments of the run that are neither referenced by the output rows of
+    # other runs (also in other archives) nor by the postprocessed tables. A
+    # full assignment has to stay, if it is the base of a delta-encoded row
+    # that stays.
+    referenced = ' UNION ALL '.join(
+        [f'SELECT assignment_id FROM {s}.output WHERE run_id != :run_id'
+         for s in ('main', *others)] +
+        ['SELECT assignment_id FROM main.output_postprocessed',
+         'SELECT assignment_id FROM main.output_checkpointed'])
+
+    bases = ' UNION ALL '.join(
+        ['SELECT base_id FROM main.assignment '
+         'WHERE id NOT IN (SELECT id FROM candidate)'] +
+        [f'SELECT base_id FROM {s}.assignment' for s in others])
+
+    return f'''
+        WITH candidate AS (
+            SELECT assignment_id AS id FROM main.output
+            WHERE run_id = :run_id AND assignment_id IS NOT NULL
+            EXCEPT
+            SELECT * FROM ({referenced}))
+        SELECT id FROM candidate
+        WHERE id NOT IN (SELECT base_id FROM ({bases}) WHERE base_id IS NOT NULL)'''
+
+
+def archive_run(db, run_id):
+    """Moves the `output` rows of the run into its archive database.
+
+    Returns the number of archived output rows and assignments.
+    """
+    assert not db.in_transaction
+    if not db.execute('SELECT 1 FROM run WHERE id = ?', (run_id,)).fetchone():
+        raise ArchiveError(f'Unknown run {run_id}')
+    if is_archived(db, run_id):
+        raise ArchiveError(f'Run {run_id} is already archived')
+
+    cur = db.execute('SELECT 1 FROM output_dirty WHERE run_id = ? '
+                     'UNION ALL '
+                     'SELECT 1 FROM output WHERE run_id = ? AND NOT EXISTS '
+                     '    (SELECT 1 FROM output_postprocessed WHERE run_id = ?)',
+                     (run_id, run_id, run_id))
+    if cur.fetchone():
+        raise ArchiveError(f'Run {run_id} has not been postprocessed')
+
+    filename = archive_filename(run_id)
+    path = gmbench.db.archive_path(filename)
+    schema = f'archive_{run_id}'
+    others = gmbench.db.attached_archives(db)
+    db.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+
+    try:
+        with db:
+            db.execute('BEGIN')
+            for sql in ARCHIVE_SCHEMA:
+                db.execute(sql.format(schema=schema))
+            # Leftovers of an interrupted attempt.
+            db.execute(f'DELETE FROM {schema}.output')
+            db.execute(f'DELETE FROM {schema}.assignment')
+
+            columns = gmbench.db.OUTPUT_COLUMN_NAMES
+            cur = db.execute(f'INSERT INTO {schema}.output ({columns}) '
+                             f'SELECT {columns} FROM main.output WHERE run_id = ?', (run_id,))
+            num_rows = cur.rowcount
+
+            db.execute('CREATE TEMP TABLE archived_assignment (id INTEGER PRIMARY KEY)')
+            db.execute('INSERT INTO archived_assignment ' +
+                       select_archived_assignments(others), {'run_id': run_id})
+            cur = db.execute(f'INSERT INTO {schema}.assignment (id, value, base_id, hash) '
+                             'SELECT id, value, base_id, hash FROM main.assignment '
+                             'WHERE id IN (SELECT id FROM archived_assignment)')
+            num_assignments = cur.rowcount
+
+            db.execute('DELETE FROM main.output WHERE run_id = ?', (run_id,))
+            db.execute('DELETE FROM main.assignment '
+                       'WHERE id IN (SELECT id FROM archived_assignment)')
+            db.execute('DROP TABLE archived_assignment')
+
+            cur = db.execute(f'SELECT coalesce(max(id), 0) FROM {schema}.assignment')
+            max_assignment_id, = cur.fetchone()
+            db.execute('INSERT INTO archive (run_id, filename, max_assignment_id) '
+                       'VALUES (?, ?, ?)', (run_id, filename, max_assignment_id))
+    except:
+        gmbench.db.detach_archives(db)
+        os.remove(path)
+        gmbench.db.attach_archives(db)
+        raise
+
+    gmbench.db.detach_archives(db)
+    gmbench.db.attach_archives(db)
+
+    return num_rows, num_assignments
+
+
+def restore_assignments(db, schema):
+    # Imports while the run was archived may have stored the same assignments
+    # again in the main database. Archived assignments are mapped to those rows
+    # by their hash (bases only to full assignments, so that the deltas stay
+    # valid), only the missing ones are restored with their original ids.
+    # Returns the number of restored assignments.
+    index = gmbench.assignment.Index(db)
+    mapping = []
+    cur = db.execute(f'SELECT id, base_id, hash FROM {schema}.assignment ORDER BY id')
+    for src_id, base_id, h in cur.fetchall():
+        dst_id = index.lookup(h, full=base_id is None) if h is not None else None
+        mapping.append((src_id, src_id if dst_id is None else dst_id, dst_id is None))
+
+    db.execute('CREATE TEMP TABLE restore_map_assignment ('
+               'src_id INTEGER PRIMARY KEY, dst_id INTEGER NOT NULL, new INTEGER NOT NULL)')
+    db.executemany('INSERT INTO restore_map_assignment (src_id, dst_id, new) VALUES (?, ?, ?)',
+                   mapping)
+
+    cur = db.execute('INSERT INTO main.assignment (id, value, base_id, hash) '
+                     'SELECT assignment.id, assignment.value, '
+                     '       coalesce(base.dst_id, assignment.base_id), assignment.hash '
+                     f'FROM {schema}.assignment AS assignment '
+                     'INNER JOIN restore_map_assignment AS map ON map.src_id = assignment.id '
+                     'LEFT OUTER JOIN restore_map_assignment AS base '
+                     '    ON base.src_id = assignment.base_id '
+                     'WHERE map.new '
+                     'ORDER BY assignment.id')
+    return cur.rowcount
+
+
+def restore_run(db, run_id):
+    """Moves the `output` rows of the run back from its archive database.
+
+    Returns the number of restored output rows and assignments.
+    """
+    assert not db.in_transaction
+    if not is_archived(db, run_id):
+        raise ArchiveError(f'Run {run_id} is not archived')
+
+    schema = f'archive_{run_id}'
+    if schema not in gmbench.db.attached_archives(db):
+        raise ArchiveError(f'Archive of run {run_id} is missing')
+
+    cur = db.execute('SELECT filename FROM archive WHERE run_id = ?', (run_id,))
+    filename, = cur.fetchone()
+
+    with db:
+        db.execute('BEGIN')
+        num_assignments = restore_assignments(db, schema)
+
+        columns = gmbench.db.OUTPUT_COLUMN_NAMES
+        select = columns.replace('assignment_id', 'coalesce(map.dst_id, output.assignment_id)')
+        cur = db.execute(f'INSERT INTO main.output ({columns}) '
+                         f'SELECT {select} FROM {schema}.output AS output '
+                         'LEFT OUTER JOIN restore_map_assignment AS map '
+                         '    ON map.src_id = output.assignment_id '
+                         'ORDER BY run_id, method_id, instance_id, trial, iteration')
+        num_rows = cur.rowcount
+
+        db.execute('DROP TABLE restore_map_assignment')
+        db.execute('DELETE FROM archive WHERE run_id = ?', (run_id,))
+
+    gmbench.db.detach_archives(db)
+    os.remove(gmbench.db.archive_path(filename))
+    gmbench.db.attach_archives(db)
+
+    return num_rows, num_assignments
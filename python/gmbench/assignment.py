@@ -0,0 +1,213 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import array
+import functools
+import hashlib
+import json
+import struct
+import sys
+
+# Consecutive assignments of a solver run usually differ only in a few labels.
+# Instead of storing every assignment in full, we store a full "base"
+# assignment and for the following assignments only the sparse list of
+# `[index, label]` pairs that differ from the base. If a delta would change
+# more than this fraction of the labels, a new full base assignment is stored
+# instead.
+MAX_DELTA_RATIO = 0.1
+
+# Values of the `assignment` table are packed as little-endian int32, `-1`
+# denotes an unassigned node. Full assignments store one label per node,
+# delta-encoded rows store the flattened `[index, label]` pairs. Databases
+# created before the packed format store JSON text instead, both formats are
+# understood by the functions below (see also `gmbench.db.migrate_assignments`).
+PACKED_DTYPE = '<i4'
+
+
+def compute_delta(base, assignment):
+    """Returns the `[index, label]` pairs that turn `base` into `assignment`.
+
+    Returns None if `assignment` should be stored in full instead.
+    """
+    if not base or len(base) != len(assignment):
+        return None
+
+    delta = [[i, label] for i, (base_label, label) in enumerate(zip(base, assignment))
+             if base_label != label]
+
+    if len(delta) > MAX_DELTA_RATIO * len(base):
+        return None
+
+    return delta
+
+
+def apply_delta(base, delta):
+    assignment = list(base)
+    for i, label in delta:
+        assignment[i] = label
+    return assignment
+
+
+def pack(labels):
+    return struct.pack(f'<{len(labels)}i', *labels)
+
+
+def unpack(value):
+    """Returns the int32 values of a packed value as list."""
+    labels = array.array('i', value)
+    if sys.byteorder != 'little':
+        labels.byteswap()
+    return labels.tolist()
+
+
+def digest(assignment):
+    """Returns a 64-bit hash of the full assignment as signed integer.
+
+    The hash is computed over the labels packed as little-endian int32, so it
+    does not depend on how the assignment is stored in the database.
+    """
+    h = hashlib.blake2b(pack(assignment), digest_size=8).digest()
+    return int.from_bytes(h, 'little', signed=True)
+
+
+def encode(assignment):
+    """Encodes a full assignment as value for the `assignment` table."""
+    return pack(assignment)
+
+
+def encode_delta(delta):
+    """Encodes a delta as value for the `assignment` table.
+
+    The base assignment is referenced by the `base_id` column of the row.
+    """
+    return pack([x for pair in delta for x in pair])
+
+
+def decode_full(value):
+    if isinstance(value, str):
+        return json.loads(value)
+    return unpack(value)
+
+
+def decode_delta(value):
+    if isinstance(value, str):
+        return json.loads(value)['delta']
+    flat = unpack(value)
+    return list(zip(flat[0::2], flat[1::2]))
+
+
+def as_array(value):
+    """Returns a full assignment value as NumPy int32 array.
+
+    Packed values are wrapped without copying, so the array is read-only.
+    """
+    import numpy
+    if isinstance(value, str):
+        return numpy.array(json.loads(value), dtype=PACKED_DTYPE)
+    return numpy.frombuffer(value, dtype=PACKED_DTYPE)
+
+
+class Decoder:
+    """Decodes values of the `assignment` table into full assignments.
+
+    Base assignments of delta-encoded rows are fetched from the database on
+    demand. As many rows share the same base, the base values are cached.
+    """
+
+    def __init__(self, db, cache_size=1024):
+        self.db = db
+        self._fetch_base = functools.lru_cache(cache_size)(self._fetch_base_uncached)
+
+    def _fetch_base_uncached(self, base_id):
+        cur = self.db.execute('SELECT value FROM assignment WHERE id = ?', (base_id,))
+        value, = cur.fetchone()
+        return value
+
+    def _fetch(self, assignment_id):
+        cur = self.db.execute('SELECT value, base_id FROM assignment WHERE id = ?',
+                              (assignment_id,))
+        return cur.fetchone()
+
+    def fetch(self, assignment_id):
+        """Fetches and decodes the assignment with the given id."""
+        return self.decode(*self._fetch(assignment_id))
+
+    def fetch_array(self, assignment_id):
+        """Like `fetch`, but returns the assignment as NumPy array."""
+        return self.decode_array(*self._fetch(assignment_id))
+
+    def decode(self, value, base_id=None):
+        if value is None:
+            return None
+
+        if base_id is None:
+            return decode_full(value)
+
+        return apply_delta(decode_full(self._fetch_base(base_id)), decode_delta(value))
+
+    def decode_array(self, value, base_id=None):
+        if value is None:
+            return None
+
+        if base_id is None:
+            return as_array(value)
+
+        assignment = as_array(self._fetch_base(base_id)).copy()
+        if isinstance(value, str):
+            for i, label in decode_delta(value):
+                assignment[i] = label
+        else:
+            delta = as_array(value).reshape(-1, 2)
+            assignment[delta[:, 0]] = delta[:, 1]
+        return assignment
+
+
+class Index:
+    """In-memory index from assignment digest to id of the `assignment` table.
+
+    The index is loaded once and then kept up to date by the caller, so that
+    deduplication does not need to query the database. Only rows that store
+    a full assignment can be used as base for delta-encoded rows, so we keep
+    track of them separately.
+    """
+
+    def __init__(self, db):
+        backfill_digests(db)
+
+        self.ids = {}
+        self.full_ids = set()
+        cur = db.execute('SELECT hash, id, base_id IS NULL FROM assignment')
+        for h, assignment_id, is_full in cur:
+            if is_full:
+                self.full_ids.add(assignment_id)
+            if h not in self.ids or is_full:
+                self.ids[h] = assignment_id
+
+        # Ids of archived assignments must not be reused, as they are restored
+        # with their original ids.
+        cur = db.execute('SELECT max((SELECT coalesce(max(id), 0) FROM assignment), '
+                         '           (SELECT coalesce(max(max_assignment_id), 0) FROM archive))')
+        self.max_id, = cur.fetchone()
+
+    def lookup(self, h, full=False):
+        assignment_id = self.ids.get(h)
+        if full and assignment_id not in self.full_ids:
+            return None
+        return assignment_id
+
+    def add(self, h, full=False):
+        """Allocates an id for a new row and returns it."""
+        self.max_id += 1
+        if full:
+            self.full_ids.add(self.max_id)
+        if h not in self.ids or full:
+            self.ids[h] = self.max_id
+        return self.max_id
+
+
+def backfill_digests(db):
+    # Rows that were inserted before the `hash` column existed.
+    cur = db.execute('SELECT id, value, base_id FROM assignment WHERE hash IS NULL')
+    decoder = Decoder(db)
+    rows = [(digest(decoder.decode(value, base_id)), assignment_id)
+            for assignment_id, value, base_id in cur.fetchall()]
+    db.executemany('UPDATE assignment SET hash = ? WHERE id = ?', rows)
@@ -0,0 +1,222 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import os
+import os.path
+import shutil
+from collections import namedtuple
+
+import numpy
+import numpy.lib.format
+
+import gmbench.db
+
+# The analysis commands read `output_postprocessed` over and over again. The
+# columnar cache holds a copy of the table as one `.npy` file per column,
+# sorted by (run, method, instance, time), together with the offsets of the
+# (run, method, instance) groups. The files are memory-mapped, so loading the
+# cache is cheap and the rows are never materialized as Python objects.
+#
+# The cache is stored in a directory next to the database and keyed to the
+# data version of the database (see `gmbench.db.bump_data_version`). If the
+# data version has changed, the cache is stale and is rebuilt on the next
+# access. The cache is built in a temporary directory that is renamed when it
+# is complete, so concurrent readers never see a partial cache.
+
+COLUMNS = (
+    ('id', numpy.int64),
+    ('run_id', numpy.int64),
+    ('method_id', numpy.int64),
+    ('instance_id', numpy.int64),
+    ('time', numpy.float64),
+    ('value', numpy.float64),
+    ('bound', numpy.float64),
+    ('assignment_id', numpy.int64),         # -1 for NULL
+    ('accuracy_all_nodes', numpy.float64),  # NaN for NULL
+    ('accuracy_known_nodes', numpy.float64),
+)
+
+GROUP_COLUMNS = (
+    ('group_offsets', numpy.int64),  # one more entry than groups
+    ('group_run_id', numpy.int64),
+    ('group_method_id', numpy.int64),
+    ('group_instance_id', numpy.int64),
+)
+
+SQL_ROWS = '''
+    SELECT id, run_id, method_id, instance_id, time, value, bound,
+           coalesce(assignment_id, -1), accuracy_all_nodes, accuracy_known_nodes
+    FROM output_postprocessed
+    ORDER BY run_id, method_id, instance_id, time, id
+'''
+
+CHUNK_SIZE = 1 << 16
+
+OutputCache = namedtuple('OutputCache', [name for name, _ in COLUMNS + GROUP_COLUMNS])
+
+
+def cache_path():
+    # The cache is stored next to the database.
+    name, _ = os.path.splitext(os.path.basename(gmbench.db.DB_FILE))
+    return os.path.join(os.path.dirname(gmbench.db.DB_FILE), f'{name}-cache')
+
+
+def version_path(version):
+    return os.path.join(cache_path(), f'v{version}')
+
+
+def fill_columns(db, allocate):
+    cur = db.cursor()
+    cur.row_factory = None
+    num_rows, = cur.execute('SELECT count(*) FROM output_postprocessed').fetchone()
+    columns = [allocate(name, dtype, num_rows) for name, dtype in COLUMNS]
+
+    cur.execute(SQL_ROWS)
+    offset = 0
+    while chunk := cur.fetchmany(CHUNK_SIZE):
+        chunk = numpy.array(chunk, dtype=numpy.float64)
+        for i, column in enumerate(columns):
+            column[offset:offset+len(chunk)] = chunk[:, i]
+        offset += len(chunk)
+    assert offset == num_rows
+
+    run_id, method_id, instance_id = columns[1:4]
+    group_start = numpy.ones(num_rows, dtype=bool)
+    group_start[1:] = ((run_id[1:] != run_id[:-1]) |
+                       (method_id[1:] != method_id[:-1]) |
+                       (instance_id[1:] != instance_id[:-1]))
+    starts = numpy.flatnonzero(group_start)
+
+    groups = []
+    for (name, dtype), values in zip(GROUP_COLUMNS, (numpy.append(starts, num_rows),
+                                                     run_id[starts], method_id[starts],
+                                                     instance_id[starts])):
+        groups.append(allocate(name, dtype, len(values)))
+        groups[-1][:] = values
+
+    return columns + groups
+
+
+def build(db, path):
+    """Dumps `output_postprocessed` into the `.npy` files of directory `path`."""
+    os.makedirs(path)
+
+    def allocate(name, dtype, size):
+        return numpy.lib.format.open_memmap(os.path.join(path, f'{name}.npy'), mode='w+',
+                                            dtype=dtype, shape=(size,))
+
+    for column in fill_columns(db, allocate):
+        column.flush()
+
+
+def load(path):
+    return OutputCache(*[numpy.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+                         for name, _ in COLUMNS + GROUP_COLUMNS])
+
+
+def load_in_memory(db):
+    def allocate(name, dtype, size):
+        return numpy.empty(size, dtype=dtype)
+
+    return OutputCache(*fill_columns(db, allocate))
+
+
+def build_atomic(db, path):
+    """Builds the cache in a temporary directory that is renamed to `path`."""
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    try:
+        build(db, tmp_path)
+        os.rename(tmp_path, path)
+    except BaseException:
+        # Also if the build is interrupted, a partial cache is never used.
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_stale(keep):
+    for name in os.listdir(cache_path()):
+        # Temporary directories of running processes that build the current
+        # version are kept, all others are leftovers.
+        version, tmp, pid = name.partition('.tmp-')
+        if tmp and version == keep and pid.isdigit() and is_running(int(pid)):
+            continue
+        if name != keep:
+            shutil.rmtree(os.path.join(cache_path(), name), ignore_errors=True)
+
+
+def ensure(db):
+    """Returns the cache of `output_postprocessed`, rebuilds it if it is stale.
+
+    If the cache directory is not writable, the columns are only built in
+    memory.
+    """
+    # The data version and the rows have to be read in the same transaction.
+    begin = not db.in_transaction
+    if begin:
+        db.execute('BEGIN')
+    try:
+        version = gmbench.db.data_version(db)
+        path = version_path(version)
+        if not os.path.isdir(path):
+            try:
+                build_atomic(db, path)
+            except OSError:
+                # Unless another process was faster, the cache directory is
+                # not writable.
+                if not os.path.isdir(path):
+                    return load_in_memory(db)
+            remove_stale(keep=os.path.basename(path))
+    finally:
+        if begin:
+            db.execute('ROLLBACK')
+
+    return load(path)
+
+
+def rename_version(old_version, new_version):
+    """Keeps the cache of `old_version` for `new_version`.
+
+    Only valid if `output_postprocessed` has not changed in between.
+    """
+    try:
+        os.rename(version_path(old_version), version_path(new_version))
+    except OSError:
+        # The cache of `old_version` is missing or the one of `new_version`
+        # already exists, both are rebuilt or cleaned up on the next access.
+        pass
+
+
+def select_run(cache, run_id):
+    """Returns the part of the cache that belongs to the run."""
+    begin, end = numpy.searchsorted(cache.group_run_id, [run_id, run_id + 1])
+    row_begin, row_end = cache.group_offsets[begin], cache.group_offsets[end]
+    rows = [column[row_begin:row_end] for column in cache[:len(COLUMNS)]]
+    groups = [cache.group_offsets[begin:end+1] - row_begin,
+              *[column[begin:end] for column in cache[len(COLUMNS)+1:]]]
+    return OutputCache(*rows, *groups)
+
+
+def searchsorted_groups(group_offsets, values, queries, side='left'):
+    """Like `numpy.searchsorted`, but separately within each group.
+
+    The `values` have to be sorted within each group, `queries` has one row of
+    values to search for each group. Returns the indexes into `values`.
+    """
+    # Complex numbers are ordered lexicographically, so the (group, value) keys
+    # are sorted and a single `searchsorted` covers all groups.
+    sizes = numpy.diff(group_offsets)
+    keys = numpy.empty(len(values), dtype=numpy.complex128)
+    keys.real, keys.imag = numpy.repeat(numpy.arange(len(sizes)), sizes), values
+    queries = numpy.asarray(queries, dtype=numpy.float64)
+    complex_queries = numpy.empty(queries.shape, dtype=numpy.complex128)
+    complex_queries.real, complex_queries.imag = numpy.arange(len(sizes))[:, None], queries
+    return numpy.searchsorted(keys, complex_queries.ravel(), side=side).reshape(queries.shape)
@@ -0,0 +1,118 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import itertools
+
+# The `output_checkpointed` table contains for each checkpoint and each
+# (run, method, instance) group the last row of `output_postprocessed` at or
+# before the checkpoint time. It is derived from `output_postprocessed` by the
+# functions in this module.
+
+COLUMNS = ('id', 'run_id', 'method_id', 'instance_id', 'time', 'value', 'bound',
+           'assignment_id', 'accuracy_all_nodes', 'accuracy_known_nodes')
+
+DIRTY_GROUPS = '(run_id, method_id, instance_id) IN (SELECT run_id, method_id, instance_id FROM output_dirty)'
+
+
+def checkpointed_rows(rows, checkpoints):
+    """Yields the rows of `output_checkpointed` for the postprocessed `rows`.
+
+    The `rows` (tuples in the order of `COLUMNS`) have to be sorted by group
+    and time. This is a single merge pass over the rows and the sorted
+    checkpoints of each group.
+    """
+    checkpoints = sorted(checkpoints)
+    for group, group_rows in itertools.groupby(rows, key=lambda row: row[1:4]):
+        i, last = 0, None
+        for row in group_rows:
+            while i < len(checkpoints) and row[4] > checkpoints[i]:
+                if last is not None:
+                    yield (checkpoints[i], *last)
+                i += 1
+            last = row
+
+        for checkpoint in checkpoints[i:]:
+            yield (checkpoint, *last)
+
+
+def cached_checkpointed_rows(output, checkpoints):
+    """Yields the rows of `output_checkpointed` for the cached `output`.
+
+    This is the NumPy counterpart of `checkpointed_rows` for the columns of
+    `gmbench.cache`. The rows of all groups and checkpoints are located with
+    a single binary search.
+    """
+    import numpy
+    import gmbench.cache
+
+    checkpoints = sorted(checkpoints)
+    starts = output.group_offsets[:-1]
+    queries = numpy.broadcast_to(checkpoints, (len(starts), len(checkpoints)))
+    index = gmbench.cache.searchsorted_groups(output.group_offsets, output.time, queries,
+                                              side='right') - 1
+
+    groups, columns = numpy.nonzero(index >= starts[:, None])
+    index = index[groups, columns]
+    values = [[checkpoints[i] for i in columns.tolist()]]
+    for name in COLUMNS:
+        # NULLs are cached as -1 and NaN, see `gmbench.cache.COLUMNS`.
+        column = getattr(output, name)[index]
+        if name == 'assignment_id':
+            null = column < 0
+        elif column.dtype == numpy.float64:
+            null = numpy.isnan(column)
+        else:
+            null = numpy.zeros(len(column), dtype=bool)
+        values.append([None if n else x for x, n in zip(column.tolist(), null.tolist())])
+
+    yield from zip(*values)
+
+
+def fetch_checkpoints(db):
+    return [row[0] for row in db.execute('SELECT time FROM checkpoint ORDER BY time')]
+
+
+def update(db, checkpoints=None, dirty_only=False, output=None):
+    """Recomputes `output_checkpointed` from `output_postprocessed`.
+
+    Only the given `checkpoints` (default: all) are recomputed. If `dirty_only`
+    is set, only the groups listed in `output_dirty` are recomputed. If the
+    cached `output` (see `gmbench.cache`) is given, the rows are computed from
+    it instead of the table.
+    """
+    assert output is None or not dirty_only
+    if checkpoints is None:
+        checkpoints = fetch_checkpoints(db)
+    if not checkpoints:
+        return
+
+    where = f'WHERE {DIRTY_GROUPS} ' if dirty_only else 'WHERE 1 '
+    placeholders = ', '.join('?' * len(checkpoints))
+    db.execute(f'DELETE FROM output_checkpointed {where} AND checkpoint IN ({placeholders})',
+               checkpoints)
+
+    columns = ', '.join(COLUMNS)
+    if output is None:
+        cur = db.execute(f'SELECT {columns} FROM output_postprocessed {where}'
+                         'ORDER BY run_id, method_id, instance_id, time, id')
+        rows = checkpointed_rows(cur, checkpoints)
+    else:
+        rows = cached_checkpointed_rows(output, checkpoints)
+    db.executemany(f'INSERT INTO output_checkpointed (checkpoint, {columns}) '
+                   f'VALUES ({", ".join("?" * (len(COLUMNS) + 1))})', rows)
+
+
+def refresh(db, output=None):
+    """Brings `output_checkpointed` in line with the `checkpoint` table.
+
+    Rows of removed checkpoints are deleted and rows for new checkpoints are
+    computed (from the cached `output`, if given), all other rows are left
+    untouched.
+    """
+    db.execute('DELETE FROM output_checkpointed '
+               'WHERE checkpoint NOT IN (SELECT time FROM checkpoint)')
+
+    cur = db.execute('SELECT time FROM checkpoint '
+                     'WHERE time NOT IN (SELECT DISTINCT checkpoint FROM output_checkpointed) '
+                     'ORDER BY time')
+    if checkpoints := [row[0] for row in cur]:
+        update(db, checkpoints, output=output)
@@ -3,10 +3,185 @@
 import os
 import os.path
 import sqlite3
+import sys
 import contextlib
 
+import gmbench.assignment
+import gmbench.checkpoint
+
+
+# Path of the database, can be changed with the environment variable
+# `GMBENCH_DATABASE` or the `--database` option of the analyzer.
+DB_FILE = os.environ.get('GMBENCH_DATABASE', 'benchmark.db')
+
+# Cache size used during bulk loads (negative values are in KiB).
+BULK_LOAD_CACHE_SIZE = -1024 * 1024
+
+# Maximum number of bytes of the database file that read-only connections map
+# into memory (SQLite caps it at its compile-time maximum).
+READONLY_MMAP_SIZE = 1 << 36
+
+# Secondary indexes are not part of `DB_SCHEMA`, because `bulk_load` drops them
+# and recreates them afterwards. They are (re-)created on every `connect`, so
+# that an interrupted bulk load does not leave the database without indexes.
+SECONDARY_INDEXES = {
+    'assignment_index_hash':
+        ('assignment',
+         'CREATE INDEX IF NOT EXISTS assignment_index_hash ON assignment (hash)'),
+    'output_index_1':
+        ('output',
+         'CREATE INDEX IF NOT EXISTS output_index_1 ON output (run_id, method_id, instance_id, trial, iteration)'),
+    'output_index_2':
+        ('output',
+         'CREATE INDEX IF NOT EXISTS output_index_2 ON output (run_id, method_id, instance_id, iteration)'),
+    'output_postprocessed_index_1':
+        ('output_postprocessed',
+         'CREATE INDEX IF NOT EXISTS output_postprocessed_index_1 ON output_postprocessed (run_id, method_id, instance_id, time)'),
+}
+
+OUTPUT_COLUMNS = '''
+    run_id INTEGER NOT NULL REFERENCES run,
+    method_id INTEGER NOT NULL REFERENCES method,
+    instance_id INTEGER NOT NULL REFERENCES instance,
+    trial INTEGER NOT NULL,
+    iteration INTEGER NOT NULL,
+    time REAL NOT NULL, -- seconds
+    value REAL NOT NULL,
+    bound REAL NOT NULL,
+    assignment_id INTEGER REFERENCES assignment,
+    CHECK((value >= 1e999) = (assignment_id IS NULL))'''
+
+OUTPUT_COLUMN_NAMES = 'run_id, method_id, instance_id, trial, iteration, time, value, bound, assignment_id'
+
+# Storage layouts of the `output` table. New databases use the `rowid` layout.
+# The `clustered` layout stores the rows ordered by their natural key, so that
+# all rows of a group are stored next to each other and the secondary indexes
+# of `output` are not needed. Use `migrate-output` to convert a database.
+OUTPUT_LAYOUTS = {
+    'rowid':
+        'CREATE TABLE IF NOT EXISTS {name} (\n'
+        '    id INTEGER PRIMARY KEY,' + OUTPUT_COLUMNS + ')',
+    'clustered':
+        'CREATE TABLE IF NOT EXISTS {name} (' + OUTPUT_COLUMNS + ',\n'
+        '    PRIMARY KEY(run_id, method_id, instance_id, trial, iteration))\n'
+        '    WITHOUT ROWID',
+}
+
+# Views that verify the raw `output` rows. If runs have been archived (see
+# `gmbench.archive`), `attach_archives` shadows them by temporary views of the
+# same name that also include the archived rows.
+VERIFICATION_VIEWS = '''
+CREATE {temp}VIEW IF NOT EXISTS output_trial_diff_range AS
+    SELECT
+        run_id                  AS run_id,
+        method_id               AS method_id,
+        instance_id             AS instance_id,
+        iteration               AS iteration,
+        max(time)  - min(time)  AS time_diff,
+        max(value) - min(value) AS value_diff
+    FROM {output} AS output
+    GROUP BY run_id, method_id, instance_id, iteration;
+
+CREATE {temp}VIEW IF NOT EXISTS verification_missing_instance_in_run AS
+    SELECT
+        run.id          AS run_id,
+        instance.id     AS instance_id,
+        instance.name   AS instance
+    FROM run, instance
+    LEFT OUTER JOIN {output} AS output ON output.run_id = run.id
+                                      AND output.instance_id == instance.id
+    WHERE output.run_id IS NULL;
+
+CREATE {temp}VIEW IF NOT EXISTS verification_missing_method_in_run AS
+    SELECT
+        run.id          AS run_id,
+        method.id       AS method_id,
+        method.name     AS method
+    FROM run, method
+    LEFT OUTER JOIN {output} AS output ON output.run_id = run.id
+                                      AND output.method_id = method.id
+    WHERE output.run_id is null;
+
+CREATE {temp}VIEW IF NOT EXISTS verification_missing_output_in_run AS
+    SELECT
+        run.id          AS run_id,
+        method.id       AS method_id,
+        method.name     AS method,
+        instance.id     AS instance_id,
+        instance.name   AS instance
+    FROM run, method, instance
+    LEFT OUTER JOIN {output} AS output ON output.run_id = run.id
+                                      AND output.method_id = method.id
+                                      AND output.instance_id = instance.id
+    WHERE output.run_id IS NULL;
+
+CREATE {temp}VIEW IF NOT EXISTS verification_missing_trial_in_run AS
+    WITH
+        trial AS (SELECT DISTINCT run_id, trial FROM {output}),
+        trial_count AS (
+            SELECT run_id, method_id, instance_id, trial, 1 AS present
+            FROM {output} AS output
+            GROUP BY run_id, method_id, instance_id, trial),
+        helper_table AS (
+            SELECT
+                trial.run_id                            AS run_id,
+                method.id                               AS method_id,
+                method.name                             AS method,
+                instance.id                             AS instance_id,
+                instance.name                           AS instance,
+                sum(trial_count.present IS NOT NULL)    AS count,
+                count(*)                                AS total
+            FROM trial, method, instance
+            LEFT OUTER JOIN trial_count ON trial_count.run_id      = trial.run_id
+                                       AND trial_count.method_id   = method.id
+                                       AND trial_count.instance_id = instance.id
+                                       AND trial_count.run_id      = trial.run_id
+                                       AND trial_count.trial       = trial.trial
+            GROUP BY trial.run_id, method.name, instance.name)
+    SELECT *
+    FROM helper_table
+    WHERE count > 0 AND count < total;
+
+CREATE {temp}VIEW IF NOT EXISTS verification_invalid_value_or_bound AS
+    SELECT
+        output.run_id   AS run_id,
+        instance.id     AS instance_id,
+        instance.name   AS instance,
+        min(value)      AS value_min,
+        max(bound)      AS bound_max,
+        max(bound) - min(value) AS diff
+    FROM {output} AS output
+    INNER JOIN instance ON instance.id = output.instance_id
+    GROUP BY output.run_id, instance.id
+    HAVING min(value) < max(bound) - 0.05;
 
-DB_FILE = 'benchmark.db'
+CREATE {temp}VIEW IF NOT EXISTS verification_invalid_optima AS
+    SELECT
+        output.run_id       AS run_id,
+        instance.id         AS instance_id,
+        instance.name       AS instance,
+        instance.optimum    AS optimum,
+        min(output.value)   AS value_min
+    FROM {output} AS output
+    INNER JOIN instance ON instance.id = output.instance_id
+    GROUP BY output.run_id, instance.id
+    HAVING value_min < instance.optimum - 0.05;
+
+CREATE {temp}VIEW IF NOT EXISTS verification_nondeterminism AS
+    SELECT
+        o.run_id            AS run_id,
+        o.method_id         AS method_id,
+        method.name         AS method, 
+        o.instance_id       AS instance_id,
+        instance.name       AS instance,
+        max(o.value_diff)   AS value_diff_max,
+        max(o.time_diff)    AS time_diff_max
+    FROM output_trial_diff_range AS o
+    INNER JOIN method ON method.id = o.method_id
+    INNER JOIN instance ON instance.id = o.instance_id
+    GROUP BY run_id, method_id, instance_id
+    HAVING value_diff_max > 0 OR time_diff_max > 10;
+'''
 
 DB_SCHEMA = '''
 
@@ -36,31 +211,63 @@ CREATE TABLE IF NOT EXISTS hardware (
     description TEXT NOT NULL,
     UNIQUE(name));
 
+-- If `base_id` is NULL, `value` is the full assignment packed as little-endian
+-- int32 (`-1` for unassigned nodes). Otherwise `value` contains the packed
+-- `[index, label]` pairs which differ from the (full) base assignment. See
+-- `gmbench.assignment` for details.
+--
+-- The `hash` column contains `gmbench.assignment.digest` of the full
+-- assignment (regardless of the encoding) and is used for deduplication.
 CREATE TABLE IF NOT EXISTS assignment (
     id INTEGER PRIMARY KEY,
-    value TEXT NOT NULL,
-    UNIQUE(value));
+    value BLOB NOT NULL,
+    base_id INTEGER REFERENCES assignment,
+    hash INTEGER);
 
 CREATE TABLE IF NOT EXISTS run (
     id INTEGER PRIMARY KEY,
     date TEXT NOT NULL DEFAULT (datetime('now', 'utc')),
     hardware_id INTEGER NOT NULL REFERENCES hardware);
 
-CREATE TABLE IF NOT EXISTS output (
+-- Records which data files have been imported into a run, so that
+-- `import-benchmark --append-to-run` can skip unchanged files.
+CREATE TABLE IF NOT EXISTS import_manifest (
     id INTEGER PRIMARY KEY,
     run_id INTEGER NOT NULL REFERENCES run,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL, -- sha256 of file content
     method_id INTEGER NOT NULL REFERENCES method,
     instance_id INTEGER NOT NULL REFERENCES instance,
     trial INTEGER NOT NULL,
-    iteration INTEGER NOT NULL,
-    time REAL NOT NULL, -- seconds
-    value REAL NOT NULL,
-    bound REAL NOT NULL,
-    assignment_id INTEGER REFERENCES assignment,
-    CHECK((value >= 1e999) = (assignment_id IS NULL)));
+    UNIQUE(run_id, path),
+    UNIQUE(run_id, method_id, instance_id, trial));
+
+''' + OUTPUT_LAYOUTS['rowid'].format(name='output') + ''';
+
+-- Version of the benchmark data. Every command that modifies data which
+-- summary tables are derived from increments it (see `bump_data_version`).
+-- It starts at a random value, so that a recreated database does not pick up
+-- the analysis cache of its predecessor (see `gmbench.cache`).
+CREATE TABLE IF NOT EXISTS data_version (
+    id INTEGER PRIMARY KEY CHECK(id = 0),
+    version INTEGER NOT NULL);
 
-CREATE INDEX IF NOT EXISTS output_index_1 ON output (run_id, method_id, instance_id, trial, iteration);
-CREATE INDEX IF NOT EXISTS output_index_2 ON output (run_id, method_id, instance_id, iteration);
+INSERT OR IGNORE INTO data_version (id, version) VALUES (0, random() & 0xffffffffffff);
+
+-- Data version each summary table has been built from.
+CREATE TABLE IF NOT EXISTS summary_stamp (
+    name TEXT PRIMARY KEY,
+    data_version INTEGER NOT NULL);
+
+-- Groups of `output` rows that have been modified since the last
+-- `postprocess`. Only these groups are recomputed by an incremental pass.
+CREATE TABLE IF NOT EXISTS output_dirty (
+    run_id INTEGER NOT NULL REFERENCES run,
+    method_id INTEGER NOT NULL REFERENCES method,
+    instance_id INTEGER NOT NULL REFERENCES instance,
+    PRIMARY KEY(run_id, method_id, instance_id));
 
 CREATE VIEW IF NOT EXISTS output_trial_diff_to_best AS
     SELECT *, time - min(time) OVER win AS time_diff
@@ -74,16 +281,14 @@ CREATE VIEW IF NOT EXISTS output_trial_max_diff_to_best AS
     FROM output_trial_diff_to_best
     GROUP BY run_id, method_id, instance_id, trial;
 
-CREATE VIEW IF NOT EXISTS output_trial_diff_range AS
-    SELECT
-        run_id                  AS run_id,
-        method_id               AS method_id,
-        instance_id             AS instance_id,
-        iteration               AS iteration,
-        max(time)  - min(time)  AS time_diff,
-        max(value) - min(value) AS value_diff
-    FROM output
-    GROUP BY run_id, method_id, instance_id, iteration;
+-- Runs whose `output` rows have been moved into a separate archive database
+-- by `archive-run` (see `gmbench.archive`). `max_assignment_id` is the highest
+-- id of the archived assignments, ids up to it are not reused.
+CREATE TABLE IF NOT EXISTS archive (
+    run_id INTEGER PRIMARY KEY REFERENCES run,
+    filename TEXT NOT NULL,
+    date TEXT NOT NULL DEFAULT (datetime('now', 'utc')),
+    max_assignment_id INTEGER NOT NULL);
 
 CREATE TABLE IF NOT EXISTS output_postprocessed (
     id INTEGER PRIMARY KEY,
@@ -98,36 +303,26 @@ CREATE TABLE IF NOT EXISTS output_postprocessed (
     accuracy_known_nodes REAL,
     CHECK((value >= 1e999) = (assignment_id IS NULL)));
 
-CREATE INDEX IF NOT EXISTS output_postprocessed_index_1 ON output_postprocessed (run_id, method_id, instance_id, time);
-
 CREATE TABLE IF NOT EXISTS checkpoint (
     time INT NOT NULL, -- seconds
     UNIQUE(time));
 
-CREATE VIEW IF NOT EXISTS output_checkpointed AS
-    WITH temp AS (
-        SELECT
-            checkpoint.time             AS checkpoint,
-            output.id                   AS id,
-            output.run_id               AS run_id,
-            output.method_id            AS method_id,
-            output.instance_id          AS instance_id,
-            output.time                 AS time,
-            output.value                AS value,
-            output.bound                AS bound,
-            output.assignment_id        AS assignment_id,
-            output.accuracy_all_nodes   AS accuracy_all_nodes,
-            output.accuracy_known_nodes AS accuracy_known_nodes,
-            row_number() OVER win AS rn
-        FROM checkpoint
-        INNER JOIN output_postprocessed AS output ON output.time <= checkpoint.time
-        WINDOW win AS (PARTITION BY checkpoint.time, output.run_id,
-                                    output.method_id, output.instance_id
-                       ORDER BY output.time DESC))
-    SELECT checkpoint, id, run_id, method_id, instance_id, time, value, bound,
-           assignment_id, accuracy_all_nodes, accuracy_known_nodes
-    FROM temp
-    WHERE rn = 1;
+-- For each checkpoint and (run, method, instance) group the last row of
+-- `output_postprocessed` at or before the checkpoint time (`id` refers to this
+-- row). The table is filled by `postprocess`, see `gmbench.checkpoint`.
+CREATE TABLE IF NOT EXISTS output_checkpointed (
+    checkpoint INT NOT NULL,
+    id INTEGER NOT NULL,
+    run_id INTEGER NOT NULL REFERENCES run,
+    method_id INTEGER NOT NULL REFERENCES method,
+    instance_id INTEGER NOT NULL REFERENCES instance,
+    time REAL NOT NULL, -- seconds
+    value REAL NOT NULL,
+    bound REAL NOT NULL,
+    assignment_id INTEGER REFERENCES assignment,
+    accuracy_all_nodes REAL,
+    accuracy_known_nodes REAL,
+    PRIMARY KEY(checkpoint, run_id, method_id, instance_id));
 
 CREATE VIEW IF NOT EXISTS benchmark AS
     SELECT
@@ -169,25 +364,23 @@ CREATE VIEW IF NOT EXISTS benchmark_pretty AS
     INNER JOIN instance ON instance.id = benchmark.instance_id
     INNER JOIN dataset  ON dataset.id  = instance.dataset_id;
 
-CREATE VIEW IF NOT EXISTS benchmark_per_dataset AS
-    SELECT
-        benchmark.run_id                        AS run_id,
-        benchmark.method_id                     AS method_id,
-        dataset.id                              AS dataset_id,
-        benchmark.checkpoint                    AS checkpoint,
-        avg(coalesce(benchmark.value,  1e999))  AS value_avg,
-        avg(coalesce(benchmark.bound, -1e999))  AS bound_avg,
-        count(benchmark.value)                  AS feasible,
-        count(*)                                AS total,
-        coalesce(sum(benchmark.optimal), 0)     AS optimal,
-        count(instance.optimum)                 AS optima_known,
-        avg(benchmark.accuracy_all_nodes)       AS accuracy_all_nodes_avg,
-        avg(benchmark.accuracy_known_nodes)     AS accuracy_known_nodes_avg,
-        count(instance.groundtruth)             AS groundtruth_known
-    FROM benchmark
-    INNER JOIN instance ON instance.id = benchmark.instance_id
-    INNER JOIN dataset  ON dataset.id  = instance.dataset_id
-    GROUP BY benchmark.run_id, benchmark.method_id, dataset.id, checkpoint;
+-- Summary of the `benchmark` view per dataset. This is a table that is built
+-- by `postprocess` and rebuilt on demand if it is stale, see `gmbench.summary`.
+CREATE TABLE IF NOT EXISTS benchmark_per_dataset (
+    run_id INTEGER NOT NULL REFERENCES run,
+    method_id INTEGER NOT NULL REFERENCES method,
+    dataset_id INTEGER NOT NULL REFERENCES dataset,
+    checkpoint INT NOT NULL,
+    value_avg REAL,
+    bound_avg REAL,
+    feasible INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    optimal INTEGER NOT NULL,
+    optima_known INTEGER NOT NULL,
+    accuracy_all_nodes_avg REAL,
+    accuracy_known_nodes_avg REAL,
+    groundtruth_known INTEGER NOT NULL,
+    PRIMARY KEY(run_id, method_id, dataset_id, checkpoint));
 
 CREATE VIEW IF NOT EXISTS benchmark_per_dataset_pretty AS
     SELECT
@@ -240,121 +433,338 @@ INSERT OR IGNORE INTO checkpoint (time) VALUES (10);
 INSERT OR IGNORE INTO checkpoint (time) VALUES (100);
 INSERT OR IGNORE INTO checkpoint (time) VALUES (300);
 
-CREATE VIEW IF NOT EXISTS verification_missing_instance_in_run AS
-    SELECT
-        run.id          AS run_id,
-        instance.id     AS instance_id,
-        instance.name   AS instance
-    FROM run, instance
-    LEFT OUTER JOIN output ON output.run_id = run.id
-                          AND output.instance_id == instance.id
-    WHERE output.id IS NULL;
+''' + VERIFICATION_VIEWS.format(temp='', output='output') + '''
+CREATE VIEW IF NOT EXISTS temp as select run_id, method_id, instance_id, trial, avg(time_diff) from output_trial_diff_to_best group by run_id, method_id, instance_id, trial;
+'''
 
-CREATE VIEW IF NOT EXISTS verification_missing_method_in_run AS
-    SELECT
-        run.id          AS run_id,
-        method.id       AS method_id,
-        method.name     AS method
-    FROM run, method
-    LEFT OUTER JOIN output ON output.run_id = run.id
-                          AND output.method_id = method.id
-    WHERE output.id is null;
 
-CREATE VIEW IF NOT EXISTS verification_missing_output_in_run AS
-    SELECT
-        run.id          AS run_id,
-        method.id       AS method_id,
-        method.name     AS method,
-        instance.id     AS instance_id,
-        instance.name   AS instance
-    FROM run, method, instance
-    LEFT OUTER JOIN output ON output.run_id = run.id
-                          AND output.method_id = method.id
-                          AND output.instance_id = instance.id
-    WHERE output.id IS NULL;
+def table_columns(db, table):
+    return [row[1] for row in db.execute(f'PRAGMA table_info({table})')]
 
-CREATE VIEW IF NOT EXISTS verification_missing_trial_in_run AS
-    WITH
-        trial AS (SELECT DISTINCT run_id, trial FROM output),
-        trial_count AS (
-            SELECT run_id, method_id, instance_id, trial, 1 AS present
-            FROM output
-            GROUP BY run_id, method_id, instance_id, trial),
-        helper_table AS (
-            SELECT
-                trial.run_id                            AS run_id,
-                method.id                               AS method_id,
-                method.name                             AS method,
-                instance.id                             AS instance_id,
-                instance.name                           AS instance,
-                sum(trial_count.present IS NOT NULL)    AS count,
-                count(*)                                AS total
-            FROM trial, method, instance
-            LEFT OUTER JOIN trial_count ON trial_count.run_id      = trial.run_id
-                                       AND trial_count.method_id   = method.id
-                                       AND trial_count.instance_id = instance.id
-                                       AND trial_count.run_id      = trial.run_id
-                                       AND trial_count.trial       = trial.trial
-            GROUP BY trial.run_id, method.name, instance.name)
-    SELECT *
-    FROM helper_table
-    WHERE count > 0 AND count < total;
 
-CREATE VIEW IF NOT EXISTS verification_invalid_value_or_bound AS
-    SELECT
-        output.run_id   AS run_id,
-        instance.id     AS instance_id,
-        instance.name   AS instance,
-        min(value)      AS value_min,
-        max(bound)      AS bound_max,
-        max(bound) - min(value) AS diff
-    FROM output
-    INNER JOIN instance ON instance.id = output.instance_id
-    GROUP BY output.run_id, instance.id
-    HAVING min(value) < max(bound) - 0.05;
+def upgrade_schema(db):
+    # `CREATE TABLE IF NOT EXISTS` will not modify tables of already existing
+    # databases. Columns that were added later on are appended here, before
+    # `DB_SCHEMA` is executed (which might refer to the new columns).
+    columns = table_columns(db, 'assignment')
+    if columns and 'base_id' not in columns:
+        db.execute('ALTER TABLE assignment ADD COLUMN base_id INTEGER REFERENCES assignment')
+    if columns and 'hash' not in columns:
+        db.execute('ALTER TABLE assignment ADD COLUMN hash INTEGER')
 
-CREATE VIEW IF NOT EXISTS verification_invalid_optima AS
-    SELECT
-        output.run_id       AS run_id,
-        instance.id         AS instance_id,
-        instance.name       AS instance,
-        instance.optimum    AS optimum,
-        min(output.value)   AS value_min
-    FROM output
-    INNER JOIN instance ON instance.id = output.instance_id
-    GROUP BY output.run_id, instance.id
-    HAVING value_min < instance.optimum - 0.05;
+    # `output_checkpointed` and `benchmark_per_dataset` used to be views. We
+    # replace them by tables. The former is filled right away, the latter is
+    # built on demand.
+    cur = db.execute("SELECT type FROM sqlite_master WHERE name = 'benchmark_per_dataset'")
+    if (row := cur.fetchone()) and row[0] == 'view':
+        db.execute('DROP VIEW benchmark_per_dataset')
 
-CREATE VIEW IF NOT EXISTS verification_nondeterminism AS
-    SELECT
-        o.run_id            AS run_id,
-        o.method_id         AS method_id,
-        method.name         AS method, 
-        o.instance_id       AS instance_id,
-        instance.name       AS instance,
-        max(o.value_diff)   AS value_diff_max,
-        max(o.time_diff)    AS time_diff_max
-    FROM output_trial_diff_range AS o
-    INNER JOIN method ON method.id = o.method_id
-    INNER JOIN instance ON instance.id = o.instance_id
-    GROUP BY run_id, method_id, instance_id
-    HAVING value_diff_max > 0 OR time_diff_max > 10;
+    cur = db.execute("SELECT type FROM sqlite_master WHERE name = 'output_checkpointed'")
+    if (row := cur.fetchone()) and row[0] == 'view':
+        db.execute('DROP VIEW output_checkpointed')
+        db.executescript(DB_SCHEMA)
+        with db:
+            gmbench.checkpoint.update(db)
 
-CREATE VIEW IF NOT EXISTS temp as select run_id, method_id, instance_id, trial, avg(time_diff) from output_trial_diff_to_best group by run_id, method_id, instance_id, trial;
-'''
+
+def migrate_unversioned(db):
+    # Databases created before the schema was versioned can be in any of the
+    # earlier states. `upgrade_schema` and `DB_SCHEMA` bring them up to date.
+    upgrade_schema(db)
+    db.executescript(DB_SCHEMA)
+
+
+# Each migration upgrades the schema from the version given by its index to
+# the next one. The version of a database is stored in `PRAGMA user_version`,
+# so `connect` only has to apply the migrations of outdated databases. Append a
+# new migration whenever `DB_SCHEMA` is changed.
+MIGRATIONS = (
+    migrate_unversioned,
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+class SchemaError(Exception):
+    pass
+
+
+def schema_version(db):
+    version, = db.execute('PRAGMA user_version').fetchone()
+    if version > SCHEMA_VERSION:
+        raise SchemaError(f'Database schema version {version} is newer than the '
+                           f'supported version {SCHEMA_VERSION}')
+    return version
+
+
+def migrate_schema(db):
+    for version in range(schema_version(db), SCHEMA_VERSION):
+        MIGRATIONS[version](db)
+        db.execute(f'PRAGMA user_version = {version + 1}')
+
+
+def data_version(db):
+    cur = db.execute('SELECT version FROM data_version')
+    return cur.fetchone()[0]
+
+
+def bump_data_version(db):
+    """Marks all summary tables as stale, see `gmbench.summary`."""
+    db.execute('UPDATE data_version SET version = version + 1')
+
+
+def mark_dirty(db, run_id, method_id, instance_id):
+    """Marks the group as modified, so that the next `postprocess` recomputes it."""
+    db.execute('INSERT OR IGNORE INTO output_dirty (run_id, method_id, instance_id) '
+               'VALUES (?, ?, ?)', (run_id, method_id, instance_id))
+
+
+def database_size(db):
+    # Make sure that the main database file contains all data.
+    db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return os.path.getsize(DB_FILE)
+
+
+def output_layout(db):
+    columns = table_columns(db, 'output')
+    return 'clustered' if columns and 'id' not in columns else 'rowid'
+
+
+def create_indexes(db):
+    # The clustered layout of `output` makes its secondary indexes redundant.
+    cur = db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    existing = {row[0] for row in cur}
+    missing = [(table, sql) for name, (table, sql) in SECONDARY_INDEXES.items()
+               if name not in existing]
+    if missing:
+        clustered = output_layout(db) == 'clustered'
+        for table, sql in missing:
+            if not (clustered and table == 'output'):
+                db.execute(sql)
+
+
+def migrate_output(db, layout):
+    """Converts the `output` table in place to the given layout.
+
+    All views are dropped and recreated, as they refer to `output`.
+    """
+    assert not db.in_transaction
+
+    detach_archives(db)
+    db.execute('PRAGMA foreign_keys = 0')
+    try:
+        with db:
+            db.execute('BEGIN')
+            cur = db.execute("SELECT name FROM sqlite_master WHERE type='view'")
+            for row in cur.fetchall():
+                db.execute(f'DROP VIEW {row[0]}')
+
+            db.execute(OUTPUT_LAYOUTS[layout].format(name='output_migrated'))
+            db.execute(f'INSERT INTO output_migrated ({OUTPUT_COLUMN_NAMES}) '
+                       f'SELECT {OUTPUT_COLUMN_NAMES} FROM output '
+                       'ORDER BY run_id, method_id, instance_id, trial, iteration')
+            db.execute('DROP TABLE output')
+            db.execute('ALTER TABLE output_migrated RENAME TO output')
+    finally:
+        db.execute('PRAGMA foreign_keys = 1')
+
+    db.executescript(DB_SCHEMA)
+    create_indexes(db)
+    attach_archives(db)
+
+
+def assignment_format(db):
+    # Databases created before the packed format have a unique constraint on
+    # the JSON encoded `value`.
+    for row in db.execute('PRAGMA index_list(assignment)'):
+        if row['origin'] == 'u':
+            return 'json'
+    return 'packed'
+
+
+def migrate_assignments(db):
+    """Converts the JSON encoded `assignment` table into the packed format.
+
+    The table is rebuilt without the unique constraint on `value`, as
+    deduplication is based on the `hash` column.
+    """
+    assert not db.in_transaction
+    decoder = gmbench.assignment.Decoder(db)
+
+    def migrated_rows(cur):
+        for assignment_id, value, base_id, h in cur:
+            if h is None:
+                h = gmbench.assignment.digest(decoder.decode(value, base_id))
+            if isinstance(value, str):
+                if base_id is None:
+                    value = gmbench.assignment.encode(gmbench.assignment.decode_full(value))
+                else:
+                    value = gmbench.assignment.encode_delta(gmbench.assignment.decode_delta(value))
+            yield assignment_id, value, base_id, h
+
+    detach_archives(db)
+    db.execute('PRAGMA foreign_keys = 0')
+    try:
+        with db:
+            db.execute('BEGIN')
+            cur = db.execute("SELECT name FROM sqlite_master WHERE type='view'")
+            for row in cur.fetchall():
+                db.execute(f'DROP VIEW {row[0]}')
+
+            db.execute('CREATE TABLE assignment_migrated ('
+                       '    id INTEGER PRIMARY KEY,'
+                       '    value BLOB NOT NULL,'
+                       '    base_id INTEGER REFERENCES assignment,'
+                       '    hash INTEGER)')
+            cur = db.execute('SELECT id, value, base_id, hash FROM assignment ORDER BY id')
+            db.executemany('INSERT INTO assignment_migrated (id, value, base_id, hash) '
+                           'VALUES                          ( ?,     ?,       ?,    ?)',
+                           migrated_rows(cur))
+            db.execute('DROP TABLE assignment')
+            db.execute('ALTER TABLE assignment_migrated RENAME TO assignment')
+    finally:
+        db.execute('PRAGMA foreign_keys = 1')
+
+    db.executescript(DB_SCHEMA)
+    create_indexes(db)
+    attach_archives(db)
+
+
+def archive_path(filename):
+    # Archive databases are stored next to the main database.
+    return os.path.join(os.path.dirname(DB_FILE), filename)
+
+
+def attach_archives(db, readonly=False):
+    """Attaches the archive databases of all archived runs.
+
+    The verification views are shadowed by temporary views that include the
+    archived `output` rows, so they transparently cover archived runs, too.
+    """
+    schemas = []
+    cur = db.execute('SELECT run_id, filename FROM archive ORDER BY run_id')
+    for run_id, filename in cur.fetchall():
+        path = archive_path(filename)
+        if not os.path.exists(path):
+            print(f'Warning: Archive {path} of run {run_id} is missing', file=sys.stderr)
+            continue
+        schema = f'archive_{run_id}'
+        if readonly:
+            path = f'file:{path}?mode=ro'
+        db.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+        schemas.append(schema)
+
+    if schemas:
+        union = ' UNION ALL '.join(f'SELECT {OUTPUT_COLUMN_NAMES} FROM {schema}.output'
+                                   for schema in ('main', *schemas))
+        db.execute(f'CREATE TEMP VIEW output_all AS {union}')
+        db.executescript(VERIFICATION_VIEWS.format(temp='TEMP ', output='output_all'))
+
+
+def attached_archives(db):
+    return [row['name'] for row in db.execute('PRAGMA database_list')
+            if row['name'].startswith('archive_')]
+
+
+def detach_archives(db):
+    cur = db.execute("SELECT name FROM temp.sqlite_master WHERE type='view'")
+    for row in cur.fetchall():
+        db.execute(f'DROP VIEW temp.{row[0]}')
+
+    for schema in attached_archives(db):
+        db.execute(f'DETACH DATABASE {schema}')
+
+
+@contextlib.contextmanager
+def bulk_load(db, tables, drop_indexes=True):
+    """Runs the body in a single transaction optimized for loading many rows.
+
+    Durability is relaxed and the page cache is enlarged. Foreign keys are not
+    checked for every row but once for all given `tables` at the end of the
+    transaction. If `drop_indexes` is set, the secondary indexes of `tables`
+    are dropped and rebuilt after the transaction (also if it was rolled back).
+    """
+    assert not db.in_transaction
+
+    synchronous, = db.execute('PRAGMA synchronous').fetchone()
+    cache_size, = db.execute('PRAGMA cache_size').fetchone()
+
+    # With WAL, `synchronous = OFF` can only lose the last transactions on
+    # power loss, the database stays consistent.
+    db.execute('PRAGMA synchronous = OFF')
+    db.execute(f'PRAGMA cache_size = {BULK_LOAD_CACHE_SIZE}')
+    db.execute('PRAGMA foreign_keys = 0')
+
+    try:
+        if drop_indexes:
+            for name, (table, sql) in SECONDARY_INDEXES.items():
+                if table in tables:
+                    db.execute(f'DROP INDEX IF EXISTS {name}')
+
+        with db:
+            yield db
+
+            for table in tables:
+                cur = db.execute(f'PRAGMA foreign_key_check({table})')
+                if row := cur.fetchone():
+                    raise sqlite3.IntegrityError(
+                        f'Foreign key violation in table {row[0]} (rowid {row[1]}) '
+                        f'referencing table {row[2]}')
+    finally:
+        create_indexes(db)
+        db.execute('PRAGMA foreign_keys = 1')
+        db.execute(f'PRAGMA cache_size = {cache_size}')
+        db.execute(f'PRAGMA synchronous = {synchronous}')
+
+
+def upgrade_outdated():
+    db = sqlite3.connect(f'file:{DB_FILE}?mode=ro', uri=True)
+    try:
+        outdated = schema_version(db) < SCHEMA_VERSION
+    finally:
+        db.close()
+
+    if outdated:
+        try:
+            with connect():
+                pass
+        except sqlite3.OperationalError as e:
+            raise SchemaError(f'Database schema is outdated and cannot be upgraded ({e}), '
+                              'run `init-database` with write access first')
 
 
 @contextlib.contextmanager
-def connect(execute_schema=True):
-    db = sqlite3.connect('benchmark.db')
+def connect(execute_schema=True, readonly=False):
+    # Read-only connections are used by worker processes that read in parallel
+    # to the (single) writer and by commands that only analyze the data. They
+    # neither touch the schema nor the journal mode, which both need write
+    # access. Memory mapping lets concurrent readers share the page cache of
+    # the operating system.
+    if readonly:
+        # Outdated databases are upgraded once with a read-write connection.
+        upgrade_outdated()
+        db = sqlite3.connect(f'file:{DB_FILE}?mode=ro', uri=True)
+    else:
+        db = sqlite3.connect(DB_FILE)
     try:
         db.row_factory = sqlite3.Row
         db.execute('PRAGMA temp_store = MEMORY')
-        db.execute('PRAGMA journal_mode = WAL')
+        if readonly:
+            db.execute(f'PRAGMA mmap_size = {READONLY_MMAP_SIZE}')
+        else:
+            db.execute('PRAGMA journal_mode = WAL')
         db.execute('PRAGMA foreign_keys = 1')
 
+        if readonly:
+            if schema_version(db) < SCHEMA_VERSION:
+                raise SchemaError('Database schema is outdated, run `init-database` '
+                                  'to upgrade it first')
+        elif execute_schema:
+            migrate_schema(db)
+            create_indexes(db)
+
         if execute_schema:
-            db.executescript(DB_SCHEMA)
+            attach_archives(db, readonly)
 
         yield db
     except:
@@ -363,6 +773,7 @@ def connect(execute_schema=True):
         # If no exception was raised while the database was passed to the user,
         # we do some maintanence before closing the database.
         # See <https://www.sqlite.org/lang_analyze.html#req>.
-        db.execute('PRAGMA optimize')
+        if not readonly:
+            db.execute('PRAGMA optimize')
     finally:
         db.close()
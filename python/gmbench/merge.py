@@ -0,0 +1,198 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import os.path
+
+import gmbench.assignment
+import gmbench.db
+
+# Several databases (e.g. filled by `import-benchmark` on different cluster
+# nodes) can be merged into one. The source database is attached as `source`
+# and its rows are copied with SQL. The ids of the source are mapped to the
+# ids of the target with temporary tables `merge_map_<table>`: Datasets,
+# instances, methods and hardware are matched by their natural key (missing
+# ones are inserted), runs are either inserted or all merged into one existing
+# run and assignments are deduplicated by their hash.
+
+# Tables that are matched by their natural key. The select statements return
+# the source id first, followed by the columns of the target table.
+MAPPED_TABLES = (
+    ('dataset', ('name',),
+     'SELECT id, name FROM source.dataset'),
+    ('instance', ('dataset_id', 'name'),
+     'SELECT instance.id, dataset.dst_id AS dataset_id, instance.number, instance.name, '
+     '       instance.optimum, instance.groundtruth '
+     'FROM source.instance AS instance '
+     'INNER JOIN merge_map_dataset AS dataset ON dataset.src_id = instance.dataset_id'),
+    ('method', ('name',),
+     'SELECT id, name FROM source.method'),
+    ('hardware', ('name',),
+     'SELECT id, name, description FROM source.hardware'),
+)
+
+SQL_OUTPUT = '''
+    SELECT
+        run.dst_id          AS run_id,
+        method.dst_id       AS method_id,
+        instance.dst_id     AS instance_id,
+        output.trial        AS trial,
+        output.iteration    AS iteration,
+        output.time         AS time,
+        output.value        AS value,
+        output.bound        AS bound,
+        assignment.dst_id   AS assignment_id
+    FROM source.output AS output
+    INNER JOIN merge_map_run      AS run      ON run.src_id      = output.run_id
+    INNER JOIN merge_map_method   AS method   ON method.src_id   = output.method_id
+    INNER JOIN merge_map_instance AS instance ON instance.src_id = output.instance_id
+    LEFT OUTER JOIN merge_map_assignment AS assignment ON assignment.src_id = output.assignment_id
+'''
+
+SQL_IMPORT_MANIFEST = '''
+    SELECT
+        run.dst_id          AS run_id,
+        manifest.path       AS path,
+        manifest.size       AS size,
+        manifest.mtime_ns   AS mtime_ns,
+        manifest.hash       AS hash,
+        method.dst_id       AS method_id,
+        instance.dst_id     AS instance_id,
+        manifest.trial      AS trial
+    FROM source.import_manifest AS manifest
+    INNER JOIN merge_map_run      AS run      ON run.src_id      = manifest.run_id
+    INNER JOIN merge_map_method   AS method   ON method.src_id   = manifest.method_id
+    INNER JOIN merge_map_instance AS instance ON instance.src_id = manifest.instance_id
+'''
+
+TABLES = ('output', 'assignment', 'import_manifest', 'output_dirty')
+
+
+class MergeError(Exception):
+    pass
+
+
+def check_source(db):
+    version, = db.execute('PRAGMA source.user_version').fetchone()
+    if version != gmbench.db.SCHEMA_VERSION:
+        raise MergeError(f'Schema version {version} of the source database does not '
+                         f'match {gmbench.db.SCHEMA_VERSION}, upgrade it first')
+
+    if db.execute('SELECT 1 FROM source.archive').fetchone():
+        raise MergeError('Source database contains archived runs, restore them first')
+
+    if db.execute('SELECT 1 FROM source.assignment WHERE hash IS NULL').fetchone():
+        raise MergeError('Source database contains assignments without hash')
+
+
+def create_map(db, table, columns=''):
+    db.execute(f'CREATE TEMP TABLE merge_map_{table} ('
+               f'src_id INTEGER PRIMARY KEY, dst_id INTEGER NOT NULL{columns})')
+
+
+def map_table(db, table, key, select):
+    cur = db.execute(f'SELECT * FROM ({select}) LIMIT 0')
+    columns = ', '.join(d[0] for d in cur.description[1:])
+    join = ' AND '.join(f'target.{k} = s.{k}' for k in key)
+
+    create_map(db, table)
+    db.execute(f'INSERT OR IGNORE INTO main.{table} ({columns}) '
+               f'SELECT {columns} FROM ({select})')
+    db.execute(f'INSERT INTO merge_map_{table} (src_id, dst_id) '
+               f'SELECT s.id, target.id FROM ({select}) AS s '
+               f'INNER JOIN main.{table} AS target ON {join}')
+
+    # Rows that collide with a target row on another unique key (e.g. the
+    # number of an instance) are neither inserted nor matched. Their output
+    # rows would be dropped silently.
+    cur = db.execute(f'SELECT {", ".join(key)} FROM ({select}) AS s '
+                     f'WHERE s.id NOT IN (SELECT src_id FROM merge_map_{table})')
+    if unmapped := cur.fetchall():
+        names = ', '.join('/'.join(str(v) for v in row) for row in unmapped)
+        raise MergeError(f'Source {table} rows conflict with the target database: {names}')
+
+
+def map_runs(db, run_id=None):
+    create_map(db, 'run')
+    cur = db.execute('SELECT run.id, run.date, hardware.dst_id FROM source.run AS run '
+                     'INNER JOIN merge_map_hardware AS hardware ON hardware.src_id = run.hardware_id')
+    for src_id, date, hardware_id in cur.fetchall():
+        if run_id is None:
+            dst_id = db.execute('INSERT INTO main.run (date, hardware_id) VALUES (?, ?)',
+                                (date, hardware_id)).lastrowid
+        else:
+            dst_id = run_id
+        db.execute('INSERT INTO merge_map_run (src_id, dst_id) VALUES (?, ?)', (src_id, dst_id))
+
+
+def map_assignments(db):
+    # Base assignments have smaller ids than the delta-encoded rows that
+    # refer to them, so the bases are always mapped first. A base is mapped
+    # to a full assignment with the same content, so the deltas stay valid.
+    index = gmbench.assignment.Index(db)
+    mapping = []
+    cur = db.execute('SELECT id, base_id, hash FROM source.assignment ORDER BY id')
+    for src_id, base_id, h in cur:
+        full = base_id is None
+        if (dst_id := index.lookup(h, full=full)) is None:
+            dst_id = index.add(h, full=full)
+            mapping.append((src_id, dst_id, True))
+        else:
+            mapping.append((src_id, dst_id, False))
+
+    create_map(db, 'assignment', ', new INTEGER NOT NULL')
+    db.executemany('INSERT INTO merge_map_assignment (src_id, dst_id, new) VALUES (?, ?, ?)',
+                   mapping)
+
+    cur = db.execute('INSERT INTO main.assignment (id, value, base_id, hash) '
+                     'SELECT map.dst_id, assignment.value, base.dst_id, assignment.hash '
+                     'FROM source.assignment AS assignment '
+                     'INNER JOIN merge_map_assignment AS map ON map.src_id = assignment.id '
+                     'LEFT OUTER JOIN merge_map_assignment AS base ON base.src_id = assignment.base_id '
+                     'WHERE map.new '
+                     'ORDER BY map.dst_id')
+    return cur.rowcount, len(mapping)
+
+
+def merge(db, filename, run_id=None):
+    """Merges the database `filename` into `db`.
+
+    All source runs are inserted as new runs, unless `run_id` is given. In
+    this case, they are merged into the existing run and replace trials that
+    are already present. The merged groups are marked as dirty.
+
+    Returns the number of merged output rows and of new and total assignments.
+    """
+    assert not db.in_transaction
+    if not os.path.exists(filename):
+        raise MergeError('No such database')
+
+    db.execute('ATTACH DATABASE ? AS source', (filename,))
+    try:
+        check_source(db)
+        with gmbench.db.bulk_load(db, TABLES, drop_indexes=run_id is None):
+            for table, key, select in MAPPED_TABLES:
+                map_table(db, table, key, select)
+            map_runs(db, run_id)
+            new_assignments, total_assignments = map_assignments(db)
+
+            if run_id is not None:
+                db.execute('DELETE FROM main.output '
+                           'WHERE (run_id, method_id, instance_id, trial) IN '
+                           f'(SELECT DISTINCT run_id, method_id, instance_id, trial FROM ({SQL_OUTPUT}))')
+
+            cur = db.execute(f'INSERT INTO main.output ({gmbench.db.OUTPUT_COLUMN_NAMES}) '
+                             f'{SQL_OUTPUT} ORDER BY 1, 2, 3, 4, 5')
+            output_rows = cur.rowcount
+
+            db.execute('INSERT OR REPLACE INTO main.import_manifest '
+                       '(run_id, path, size, mtime_ns, hash, method_id, instance_id, trial) '
+                       f'{SQL_IMPORT_MANIFEST}')
+            db.execute('INSERT OR IGNORE INTO main.output_dirty (run_id, method_id, instance_id) '
+                       f'SELECT DISTINCT run_id, method_id, instance_id FROM ({SQL_OUTPUT})')
+            gmbench.db.bump_data_version(db)
+
+            for table in ('dataset', 'instance', 'method', 'hardware', 'run', 'assignment'):
+                db.execute(f'DROP TABLE merge_map_{table}')
+    finally:
+        db.execute('DETACH DATABASE source')
+
+    return output_rows, new_assignments, total_assignments
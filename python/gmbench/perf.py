@@ -1,122 +1,237 @@
 # Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
 
+from collections import namedtuple
+
+import numpy
+
+import gmbench.cache
+
 DEFAULT_MIN_RUNTIME = 0.01
 DEFAULT_OPTIMALITY_TOLERANCE = 0.1 # percent
 DEFAULT_MAX_PERF_RATIO = 1000
 
-SQL_QUERY = '''
-    WITH
-        best_observed AS (
-            SELECT instance_id, min(value) AS value
-            FROM output_postprocessed
-            WHERE run_id = :run_id
-            GROUP BY instance_id),
-        best_known AS (
-            SELECT id AS instance_id, optimum AS value
-            FROM instance
-            WHERE optimum IS NOT NULL),
-        best_union AS (
-            SELECT * FROM best_observed
-            UNION ALL
-            SELECT * FROM best_known),
-        best AS (
-            SELECT instance_id, max(value) AS value
-            FROM best_union
-            GROUP BY instance_id),
-        opt_per_instance AS (
-            SELECT
-                output.run_id,
-                output.method_id,
-                output.instance_id,
-                CASE WHEN min(output.time) < :min_runtime THEN :min_runtime
-                     ELSE min(output.time)
-                END AS time
-            FROM output_postprocessed AS output
-            INNER JOIN instance ON instance.id = output.instance_id
-            INNER JOIN best ON best.instance_id = output.instance_id
-            WHERE output.run_id = :run_id
-              AND output.value <= best.value + :optimality_tolerance * abs(best.value)
-              AND (:dataset_id IS NULL OR instance.dataset_id = :dataset_id)
-            GROUP BY output.run_id, output.method_id, output.instance_id),
-        best_opt_per_instance AS (
-            SELECT run_id, instance_id, min(time) AS time
-            FROM opt_per_instance AS opt
-            GROUP BY opt.run_id, opt.instance_id),
-        perf_ratio AS (
-            SELECT
-                opt.run_id,
-                opt.method_id,
-                opt.instance_id,
-                opt.time / best_opt.time AS perf_ratio
-            FROM opt_per_instance AS opt
-            INNER JOIN best_opt_per_instance AS best_opt ON best_opt.run_id = opt.run_id
-                                                        AND best_opt.instance_id = opt.instance_id
-            WHERE opt.time / best_opt.time IS NOT NULL),
-        final_with_duplicates AS (
-            SELECT
-                method.name             AS method,
-                perf_ratio.perf_ratio   AS perf_ratio,
-                row_number() OVER win   AS instances
-            FROM perf_ratio
-            INNER JOIN method ON method.id = perf_ratio.method_id
-            WHERE (:max_perf_ratio IS NULL OR perf_ratio.perf_ratio < :max_perf_ratio)
-            WINDOW win AS (PARTITION BY perf_ratio.method_id
-                           ORDER BY perf_ratio.perf_ratio
-                           ROWS UNBOUNDED PRECEDING))
-    SELECT method, perf_ratio, max(instances) AS instances
-    FROM final_with_duplicates
-    GROUP BY method, perf_ratio
-'''
+# Performance profiles are derived from the time each method needs to reach
+# the target value of an instance (the best value of the run or the known
+# optimum, whichever is larger, plus the optimality tolerance). The times are
+# computed once for all instances in a single pass over the run's rows of
+# `output_postprocessed` in the columnar cache (see `gmbench.cache`). The
+# profiles of all datasets are then derived from this table with NumPy.
+#
+# The values of each (method, instance) group in `output_postprocessed` are
+# the best values so far, i.e. they are monotonically decreasing over time.
+# So the first row that reaches a target is found by binary search, and the
+# first-hit times for any number of tolerances come from the same pass.
+
+# All instances, sorted by id. Unknown optima are NaN.
+Instances = namedtuple('Instances', 'ids dataset_ids optima')
+
+# First-hit times for each (method, instance) group of the run. The instances
+# are given by their index in `Instances`, `times` has one column per
+# tolerance and is NaN if the group never reaches the target.
+FirstHitTimes = namedtuple('FirstHitTimes', 'method_ids instance_index times')
+
+# Time to target for each (method, instance) that reached the target.
+TimeToTarget = namedtuple('TimeToTarget', 'method_ids instance_index times')
+
+# One profile of a parameter sweep.
+SweepRow = namedtuple('SweepRow', 'optimality_tolerance min_runtime method area x y')
+
+
+def fetch_instances(db):
+    cur = db.execute('SELECT id, dataset_id, optimum FROM instance ORDER BY id')
+    rows = numpy.array(cur.fetchall(), dtype=numpy.float64).reshape(-1, 3)
+    return Instances(ids=rows[:, 0].astype(numpy.int64),
+                     dataset_ids=rows[:, 1].astype(numpy.int64),
+                     optima=rows[:, 2])
+
+
+def compute_first_hit_times(db, run_id, instances, optimality_tolerances):
+    output = gmbench.cache.select_run(gmbench.cache.ensure(db), run_id)
+    instance_index = numpy.searchsorted(instances.ids, output.instance_id)
+    times, values = output.time, output.value
+    starts, ends = output.group_offsets[:-1], output.group_offsets[1:]
+
+    # The target is the best observed value of the run or the known optimum,
+    # whichever is larger (NaN for unknown optima is ignored by `fmax`).
+    best = numpy.full(len(instances.ids), numpy.inf)
+    numpy.minimum.at(best, instance_index, values)
+    best = numpy.fmax(best, instances.optima)
+    best = best[instance_index[starts]]
+    tolerances = numpy.asarray(optimality_tolerances, dtype=numpy.float64) / 100.0
+    targets = best[:, None] + tolerances[None, :] * numpy.abs(best)[:, None]
+
+    # The values are decreasing within each group, so the negated values are
+    # sorted and the first row with `value <= target` is found by binary
+    # search for all groups and tolerances at once.
+    hit = gmbench.cache.searchsorted_groups(output.group_offsets, -values, -targets)
+
+    reached = (hit < ends[:, None]) & ~numpy.isnan(targets)
+    first_hit_times = numpy.where(reached, times[numpy.minimum(hit, len(values) - 1)], numpy.nan)
+    return FirstHitTimes(output.group_method_id, instance_index[starts], first_hit_times)
+
+
+def compute_time_to_target(first_hit_times, column, min_runtime):
+    times = first_hit_times.times[:, column]
+    reached = ~numpy.isnan(times)
+    times = times[reached]
+    if min_runtime is not None:
+        times = numpy.maximum(times, min_runtime)
+    return TimeToTarget(first_hit_times.method_ids[reached],
+                        first_hit_times.instance_index[reached],
+                        times)
 
 
 def compute_area(method_data, max_perf_ratio):
-    x = method_data['x']
-    y = method_data['y']
+    x = numpy.asarray(method_data['x'])
+    y = numpy.asarray(method_data['y'])
     assert len(x) == len(y)
+    assert numpy.all(x[1:] < max_perf_ratio + 1e-8)
+    assert numpy.all(x[:-1] <= x[1:])
+
+    # Accumulated in order (like a plain loop) with `cumsum`.
+    area = numpy.cumsum(y[:-1] * (x[1:] - x[:-1]))
+    area = area[-1] if len(area) else 0
+    return float(area + y[-1] * (max_perf_ratio - x[-1]))
+
+
+def select_dataset(instances, time_to_target, dataset_id):
+    """Returns the mask of `time_to_target` and the number of instances of the dataset."""
+    if dataset_id is None:
+        return numpy.ones(len(time_to_target.times), dtype=bool), len(instances.ids)
+
+    mask = instances.dataset_ids[time_to_target.instance_index] == dataset_id
+    return mask, numpy.count_nonzero(instances.dataset_ids == dataset_id)
+
+
+def compute_profiles(time_to_target, method_names, mask, total, max_perf_ratio):
+    """Computes the performance profiles of the (method, instance) pairs in `mask`."""
+    method_ids = time_to_target.method_ids[mask]
+    instance_index = time_to_target.instance_index[mask]
+    times = time_to_target.times[mask]
+
+    best = numpy.full(instance_index.max(initial=-1) + 1, numpy.inf)
+    numpy.minimum.at(best, instance_index, times)
+    best = best[instance_index]
+
+    # A ratio with zero best time is undefined (NULL in SQL).
+    valid = best != 0
+    ratios = times[valid] / best[valid]
+    method_ids = method_ids[valid]
+    if max_perf_ratio is not None:
+        keep = ratios < max_perf_ratio
+        method_ids, ratios = method_ids[keep], ratios[keep]
+
+    data = {}
+    for method_id in sorted(numpy.unique(method_ids), key=lambda i: method_names[i]):
+        x = numpy.sort(ratios[method_ids == method_id])
+        # For equal ratios only the last (highest) count is kept.
+        last = numpy.append(x[1:] != x[:-1], True)
+        counts = numpy.flatnonzero(last) + 1
+        data[method_names[method_id]] = {'x': x[last].tolist(),
+                                         'y': (counts / total * 100).tolist()}
+
+    # Augment data by additional information.
+    if max_perf_ratio is not None:
+        for method_data in data.values():
+            method_data['area'] = compute_area(method_data, max_perf_ratio)
 
-    area = 0
-    for i in range(1, len(x)):
-        assert x[i] < max_perf_ratio + 1e-8
-        assert x[i-1] <= x[i]
-        area += y[i-1] * (x[i] - x[i-1])
-    area += y[-1] * (max_perf_ratio - x[-1])
+    return data
+
+
+def compute_profiles_for_datasets(db, run_id, dataset_ids, max_perf_ratio, min_runtime,
+                                  optimality_tolerance):
+    """Returns the performance profiles for each of the given datasets.
+
+    A dataset id of None stands for all instances. The run's rows are only
+    read once, regardless of the number of datasets. Without `max_perf_ratio`
+    and `min_runtime` the ratios are neither limited nor are the times
+    clamped, the areas are only computed with a `max_perf_ratio`.
+    """
+    instances = fetch_instances(db)
+    method_names = dict(db.execute('SELECT id, name FROM method').fetchall())
+    first_hit_times = compute_first_hit_times(db, run_id, instances, [optimality_tolerance])
+    time_to_target = compute_time_to_target(first_hit_times, 0, min_runtime)
+
+    result = []
+    for dataset_id in dataset_ids:
+        mask, total = select_dataset(instances, time_to_target, dataset_id)
+        result.append(compute_profiles(time_to_target, method_names, mask, total,
+                                       max_perf_ratio))
+
+    return result
+
+
+def compute_performance_plot_data_for_datasets(db, run_id, dataset_ids,
+                                               max_perf_ratio=None,
+                                               min_runtime=None,
+                                               optimality_tolerance=None):
+    """Like `compute_profiles_for_datasets`, but with the default parameters."""
+    if max_perf_ratio is None:
+        max_perf_ratio = DEFAULT_MAX_PERF_RATIO
+    if min_runtime is None:
+        min_runtime = DEFAULT_MIN_RUNTIME
+    if optimality_tolerance is None:
+        optimality_tolerance = DEFAULT_OPTIMALITY_TOLERANCE
 
-    return area
+    return compute_profiles_for_datasets(db, run_id, dataset_ids, max_perf_ratio,
+                                         min_runtime, optimality_tolerance)
 
 
 def compute_performance_plot_data(db, run_id, dataset_id=None,
                                   max_perf_ratio=None,
                                   min_runtime=None,
                                   optimality_tolerance=None):
+    result, = compute_performance_plot_data_for_datasets(db, run_id, [dataset_id],
+                                                         max_perf_ratio,
+                                                         min_runtime,
+                                                         optimality_tolerance)
+    return result
+
+
+def compute_performance_sweep(db, run_id, optimality_tolerances, min_runtimes,
+                              dataset_id=None, max_perf_ratio=None):
+    """Returns the performance profiles for all combinations of parameters.
+
+    The result is a list of `SweepRow`, one for each combination of
+    tolerance, minimal runtime and method. The first-hit times of all
+    tolerances are computed in a single scan over the run's rows.
+    """
     if max_perf_ratio is None:
         max_perf_ratio = DEFAULT_MAX_PERF_RATIO
-    if min_runtime is None:
-        min_runtime = DEFAULT_MIN_RUNTIME
+
+    instances = fetch_instances(db)
+    method_names = dict(db.execute('SELECT id, name FROM method').fetchall())
+    first_hit_times = compute_first_hit_times(db, run_id, instances, optimality_tolerances)
+
+    result = []
+    for column, optimality_tolerance in enumerate(optimality_tolerances):
+        for min_runtime in min_runtimes:
+            time_to_target = compute_time_to_target(first_hit_times, column, min_runtime)
+            mask, total = select_dataset(instances, time_to_target, dataset_id)
+            data = compute_profiles(time_to_target, method_names, mask, total, max_perf_ratio)
+            for method, method_data in data.items():
+                result.append(SweepRow(optimality_tolerance, min_runtime, method,
+                                       method_data['area'], method_data['x'], method_data['y']))
+
+    return result
+
+
+def compute_cactus_plot_data(db, run_id, dataset_id=None, optimality_tolerance=None):
+    """Returns the cumulative time to target over the number of solved instances."""
     if optimality_tolerance is None:
         optimality_tolerance = DEFAULT_OPTIMALITY_TOLERANCE
 
-    cur = db.execute('SELECT count(*) FROM instance '
-                     'WHERE :dataset_id IS NULL OR dataset_id = :dataset_id',
-                     {'dataset_id': dataset_id})
-    total, = cur.fetchone()
-
-    cur = db.execute(SQL_QUERY, {'run_id': run_id,
-                                 'dataset_id': dataset_id,
-                                 'min_runtime': min_runtime,
-                                 'max_perf_ratio': max_perf_ratio,
-                                 'optimality_tolerance': optimality_tolerance / 100.0})
+    instances = fetch_instances(db)
+    method_names = dict(db.execute('SELECT id, name FROM method').fetchall())
+    first_hit_times = compute_first_hit_times(db, run_id, instances, [optimality_tolerance])
+    time_to_target = compute_time_to_target(first_hit_times, 0, None)
+    mask, total = select_dataset(instances, time_to_target, dataset_id)
+    method_ids, times = time_to_target.method_ids[mask], time_to_target.times[mask]
 
-    # Fetch data from database.
     data = {}
-    for row in cur:
-        method = row['method']
-        if not method in data:
-            data[method] = {'x': [], 'y': []}
-        data[method]['x'].append(row['perf_ratio'])
-        data[method]['y'].append(row['instances'] / total * 100)
+    for method_id in sorted(numpy.unique(method_ids), key=lambda i: method_names[i]):
+        x = numpy.cumsum(numpy.sort(times[method_ids == method_id]))
+        data[method_names[method_id]] = {'x': x.tolist(),
+                                         'y': list(range(1, len(x) + 1))}
 
-    # Augment data by additional information.
-    for method_data in data.values():
-        method_data['area'] = compute_area(method_data, max_perf_ratio)
-
-    return data
+    return data, total
@@ -0,0 +1,53 @@
+# Author: Stefan Haller <stefan.haller@iwr.uni-heidelberg.de>
+
+import gmbench.db
+
+# The summary table `benchmark_per_dataset` aggregates the cross join of run,
+# method, instance and checkpoint (the `benchmark` view). This is too slow to
+# be evaluated for every query, so the result is stored together with the data
+# version it has been built from (table `summary_stamp`). If the data version
+# has changed in the meantime, the table is stale and is rebuilt on the next
+# access.
+
+SQL_BENCHMARK_PER_DATASET = '''
+    INSERT INTO benchmark_per_dataset
+    SELECT
+        benchmark.run_id                        AS run_id,
+        benchmark.method_id                     AS method_id,
+        dataset.id                              AS dataset_id,
+        benchmark.checkpoint                    AS checkpoint,
+        avg(coalesce(benchmark.value,  1e999))  AS value_avg,
+        avg(coalesce(benchmark.bound, -1e999))  AS bound_avg,
+        count(benchmark.value)                  AS feasible,
+        count(*)                                AS total,
+        coalesce(sum(benchmark.optimal), 0)     AS optimal,
+        count(instance.optimum)                 AS optima_known,
+        avg(benchmark.accuracy_all_nodes)       AS accuracy_all_nodes_avg,
+        avg(benchmark.accuracy_known_nodes)     AS accuracy_known_nodes_avg,
+        count(instance.groundtruth)             AS groundtruth_known
+    FROM benchmark
+    INNER JOIN instance ON instance.id = benchmark.instance_id
+    INNER JOIN dataset  ON dataset.id  = instance.dataset_id
+    GROUP BY benchmark.run_id, benchmark.method_id, dataset.id, checkpoint
+'''
+
+
+def is_fresh(db, name='benchmark_per_dataset'):
+    cur = db.execute('SELECT data_version FROM summary_stamp WHERE name = ?', (name,))
+    row = cur.fetchone()
+    return row is not None and row[0] == gmbench.db.data_version(db)
+
+
+def build(db):
+    """Rebuilds the summary table and stamps it with the current data version."""
+    db.execute('DELETE FROM benchmark_per_dataset')
+    db.execute(SQL_BENCHMARK_PER_DATASET)
+    db.execute('INSERT OR REPLACE INTO summary_stamp (name, data_version) VALUES (?, ?)',
+               ('benchmark_per_dataset', gmbench.db.data_version(db)))
+
+
+def ensure(db):
+    """Rebuilds the summary table if it is stale."""
+    if not is_fresh(db):
+        with db:
+            build(db)